@@ -0,0 +1,40 @@
+import os, sys
+import pytest
+
+# The wedgie modules import each other by module name, as getWedge.py and plotWedge.py do.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'wedgie'))
+
+import synth_utils as syn
+
+# Synthetic data set of the wedge tests: the first NANTS antennae of hsa7458_v001, the
+# rest of which are excluded, over NFILES files of NTIMES integrations and NCHAN channels.
+# An integration with no flags has a zero CLEAN kernel, and so a NaN wedge, so half of
+# the samples are flagged.
+CALFILE = 'hsa7458_v001'
+NANTS = 7
+NFILES = 3
+NTIMES = 4
+NCHAN = 32
+FLAG_FRAC = 0.5
+
+def write_data(path, flag_frac=FLAG_FRAC, flag_first=False):
+    """
+    Returns the xx, xy, yx and yy file lists of the synthetic data set and its ex_ants.
+    """
+    positions = syn.hsa_positions(NANTS)
+    files = syn.write_files(path, positions, NFILES, NTIMES, NCHAN, flag_frac, pols=('xx', 'xy', 'yx', 'yy'), flag_first=flag_first)
+    ex_ants = sorted(set(syn.hsa_positions()) - set(positions))
+
+    return files, ex_ants
+
+@pytest.fixture(scope='session')
+def synth_data(tmpdir_factory):
+    return write_data(str(tmpdir_factory.mktemp('synth')))
+
+@pytest.fixture(scope='session')
+def fixed_gain_data(tmpdir_factory):
+    """
+    The synthetic data set with the first integration of every file flagged, so that the
+    CLEAN gains are the same in every file.
+    """
+    return write_data(str(tmpdir_factory.mktemp('fixed_gain')), flag_first=True)
@@ -0,0 +1,55 @@
+import imageio
+import numpy as np
+import pytest
+import anim_utils as au
+
+NFRAMES = 5
+
+def frames(nframes=NFRAMES, shape=(40, 60, 3)):
+    """
+    Yields nframes different frames, so that none of them can be merged in the animation.
+    """
+    rng = np.random.RandomState(0)
+    for index in range(nframes):
+        yield rng.randint(0, 256, shape).astype(np.uint8)
+
+def test_write_animation(tmpdir):
+    gif = str(tmpdir.join('frames.gif'))
+    assert au.write_animation(gif, au.prefetch(frames(), depth=2), duration=0.5) == NFRAMES
+
+    written = imageio.mimread(gif)
+    assert len(written) == NFRAMES
+    assert all(frame.shape[:2] == (40, 60) for frame in written)
+
+def test_read_frames_downsample(tmpdir):
+    images = []
+    for index, frame in enumerate(frames()):
+        images.append(str(tmpdir.join('{}.png'.format(index))))
+        imageio.imwrite(images[-1], frame)
+
+    gif = str(tmpdir.join('images.gif'))
+    assert au.write_animation(gif, au.prefetch(au.read_frames(images, factor=2))) == NFRAMES
+
+    written = imageio.mimread(gif)
+    assert len(written) == NFRAMES
+    assert all(frame.shape[:2] == (20, 30) for frame in written)
+
+def test_prefetch_raises():
+    def failing():
+        yield np.zeros((2, 2, 3), dtype=np.uint8)
+        raise IOError('unreadable frame')
+
+    prefetched = au.prefetch(failing())
+    next(prefetched)
+    with pytest.raises(IOError):
+        next(prefetched)
+
+def test_anim_name():
+    files = ['/data/zen.2457746.{}.xx.HH.uvcOR'.format(time) for time in (16693, 16755, 16817)]
+    assert au.anim_name(files) == './day2457746__3files__start16693__end16817.gif'
+
+    npzs = ['out/zen.2457746.16693_16693.xx.HH.uvcOR.550_650.timavg.npz', 'out/zen.2457746.16693_16755.xx.HH.uvcOR.550_650.timavg.npz', 'out/zen.2457746.16755_16842.xx.HH.uvcOR.550_650.timavg.npz']
+    assert au.anim_name(npzs, 'anims/', 'mp4') == 'anims/day2457746__3files__start16693__end16842.mp4'
+
+    pngs = [npz[:-3] + 'png' for npz in npzs]
+    assert au.anim_name(pngs) == './day2457746__3files__start16693__end16842.gif'
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+import wedge_utils as wu
+import hsa7458_v001 as cal
+from conftest import CALFILE
+
+def decimal_baselines(ex_ants):
+    """
+    Groups the pairs of hsa7458_v001 without ex_ants as getWedge always has: by the
+    Decimal length and slope of every pair, one pair at a time.
+    """
+    antennae = cal.prms['antpos_ideal']
+    ants = [ant for ant in antennae.keys() if not antennae[ant]['top_z'] < 0 and ant not in ex_ants]
+
+    pairs = {}
+    for ant_i in ants:
+        for ant_j in ants:
+            if ant_i < ant_j:
+                pairs[(ant_i, ant_j)] = (wu.calculate_baseline(antennae, (ant_i, ant_j)), wu.calculate_slope(antennae, (ant_i, ant_j)))
+
+    antdict, slopedict = {}, {}
+    for pair, (baseline, slope) in pairs.items():
+        antdict.setdefault(baseline, []).append(pair)
+        slopedict.setdefault(baseline, {}).setdefault(slope, []).append(pair)
+
+    baselines, slopes = set(bl for bl, slope in pairs.values()), set(slope for bl, slope in pairs.values())
+    return antdict, slopedict, pairs, sorted(baselines), sorted(slopes)
+
+def sort_pairs(groups):
+    return dict((key, sort_pairs(value) if isinstance(value, dict) else sorted(value)) for key, value in groups.items())
+
+@pytest.mark.parametrize('ex_ants', [[], [9, 20, 53, 80, 104]])
+def test_get_baselines_matches_decimal(ex_ants):
+    antdict, slopedict, pairs, baselines, slopes = wu.get_baselines(CALFILE, ex_ants)
+    _antdict, _slopedict, _pairs, _baselines, _slopes = decimal_baselines(ex_ants)
+
+    nants = len(set(ant for pair in _pairs for ant in pair))
+    assert nants == 19 - len(ex_ants)
+    assert len(pairs) == nants * (nants - 1) // 2
+    assert pairs == _pairs
+    assert sort_pairs(antdict) == sort_pairs(_antdict)
+    assert sort_pairs(slopedict) == sort_pairs(_slopedict)
+    assert baselines == _baselines
+    assert slopes == _slopes
+
+def test_get_baselines_cache_dir(tmpdir):
+    ex_ants = [9, 20]
+    redundancy = wu.get_redundancy(CALFILE, ex_ants, cache_dir=str(tmpdir.join('aa')))
+    assert len(tmpdir.join('aa').listdir()) == 1
+
+    cached = wu.get_redundancy(CALFILE, ex_ants, cache_dir=str(tmpdir.join('aa')))
+    for key, value in redundancy.items():
+        np.testing.assert_array_equal(cached[key], value)
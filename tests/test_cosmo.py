@@ -0,0 +1,59 @@
+import numpy as np
+import cosmo_utils as cu
+from astropy.cosmology import Planck15 as cosmo
+from astropy import units as u
+from astropy import constants as c
+
+# Accuracy of the fast path, which interpolates the comoving distance, against astropy.
+RTOL = 1e-7
+
+# Frequencies (GHz) and redshifts across the band of the comoving distance table.
+FQS = np.linspace(cu.TABLE_BAND[0], cu.TABLE_BAND[1], 401)
+ZS = cu.F21 / FQS - 1.
+
+# The conversions as computed with astropy Quantities throughout.
+def f2z(fq):
+    return 1.42040575177 * u.GHz / fq - 1.
+
+def dL_df(z):
+    return (1.7 / 0.1) * (np.sqrt((1 + z) / 10.) * (1. / np.sqrt(cosmo.Om0 / 0.15)) * 1e3) * u.Mpc / u.GHz
+
+def dL_dth(z):
+    return 1.9 * (1. / 0.000291) * np.power((1 + z) / 10., 0.2) * u.Mpc / u.radian
+
+def uv2kpr(blmag, cen_fq):
+    uvmag = blmag / (c.c / cen_fq)
+    return (2 * np.pi * uvmag / (cosmo.comoving_transverse_distance(f2z(cen_fq)) * cosmo.h)).to(1. / u.Mpc)
+
+def freq2kpl(freqs):
+    cen_fq = (freqs[0] + freqs[-1]) / 2.
+    etas = np.fft.fftfreq(len(freqs), (freqs[1] - freqs[0]).to(u.GHz).value) * u.ns
+    return np.fft.fftshift(((2 * np.pi / dL_df(f2z(cen_fq))).to(u.GHz / u.Mpc) * etas).to(1. / u.Mpc).value)
+
+def test_f2z():
+    np.testing.assert_allclose(cu.f2z_fast(FQS), f2z(FQS * u.GHz).value, rtol=RTOL)
+
+def test_comoving_transverse_distance():
+    np.testing.assert_allclose(cu.comoving_transverse_distance_fast(ZS), cosmo.comoving_transverse_distance(ZS).to(u.Mpc).value, rtol=RTOL)
+
+    # Redshifts outside the table are integrated by astropy.
+    outside = np.array([ZS[-1] + 1., ZS[0] - 1.])
+    np.testing.assert_allclose(cu.comoving_transverse_distance_fast(outside), cosmo.comoving_transverse_distance(outside).to(u.Mpc).value, rtol=RTOL)
+
+def test_distance_derivatives():
+    np.testing.assert_allclose(cu.dL_df_fast(ZS), dL_df(ZS).to(u.Mpc / u.GHz).value, rtol=RTOL)
+    np.testing.assert_allclose(cu.dL_dth_fast(ZS), dL_dth(ZS).to(u.Mpc / u.radian).value, rtol=RTOL)
+    np.testing.assert_allclose(cu.dk_du_fast(ZS), (2 * np.pi / dL_dth(ZS)).to(u.radian / u.Mpc).value, rtol=RTOL)
+    np.testing.assert_allclose(cu.dk_deta_fast(ZS), (2 * np.pi / dL_df(ZS)).to(u.GHz / u.Mpc).value, rtol=RTOL)
+
+def test_uv2kpr():
+    blmag = np.array([14.6, 29.2, 102.2, 300.])
+    for cen_fq in FQS[::20]:
+        np.testing.assert_allclose(cu.uv2kpr_fast(blmag, cen_fq), uv2kpr(blmag * u.m, cen_fq * u.GHz).value, rtol=RTOL)
+        assert cu.uv2kpr(blmag * u.m, cen_fq * 1e3 * u.MHz).unit == 1. / u.Mpc
+
+def test_freq2kpl():
+    for start in FQS[:-64:40]:
+        freqs = start + 0.1 / 1024 * np.arange(64)
+        np.testing.assert_allclose(cu.freq2kpl_fast(freqs), freq2kpl(freqs * u.GHz), rtol=RTOL, atol=0)
+        np.testing.assert_allclose(cu.freq2kpl(freqs).value, freq2kpl(freqs * u.GHz), rtol=RTOL, atol=0)
@@ -0,0 +1,76 @@
+import aipy
+import numpy as np
+import deconv_utils as du
+
+NCHAN = 64
+
+def delay_rows(nrows, seed=0, flag_frac=0.2):
+    """
+    Returns nrows of windowed, delay transformed random visibilities and their kernels,
+    as wedge_utils.delay_models CLEANs them.
+    """
+    rng = np.random.RandomState(seed)
+    w = aipy.dsp.gen_window(NCHAN, 'blackman-harris')
+    flags = rng.rand(nrows, NCHAN) > flag_frac
+    vis = rng.randn(nrows, NCHAN) + 1j * rng.randn(nrows, NCHAN)
+
+    return np.fft.ifft(vis * flags * w, axis=-1), np.fft.ifft(flags * w, axis=-1)
+
+def aipy_clean(im, ker, tol=1e-3):
+    mdl, res, terms = np.empty_like(im), np.empty_like(im), []
+    for row in range(len(im)):
+        mdl[row], info = aipy.deconv.clean(im[row], ker[row], tol=tol)
+        res[row] = info['res']
+        terms.append(info['term'])
+    return mdl, res, terms
+
+def assert_within_peak(a, b, im, rtol=1e-12):
+    """
+    Asserts that a and b are NaN in the same places and otherwise agree to within rtol of
+    the peak of each row of im.
+    """
+    assert np.array_equal(np.isnan(a), np.isnan(b))
+    peak = np.abs(im).max(axis=1)[:, np.newaxis]
+    diff = np.where(np.isnan(a), 0., np.abs(a - b))
+    assert (diff <= rtol * peak).all()
+
+def test_hogbom_matches_aipy():
+    im, ker = delay_rows(50)
+    mdl, res, terms = aipy_clean(im, ker)
+    _mdl, _res = du.hogbom(im, ker)
+
+    assert_within_peak(_mdl, mdl, im)
+    assert_within_peak(_res, res, im)
+
+def test_hogbom_zero_kernels():
+    im, ker = delay_rows(6, seed=1)
+    ker[::2] = 0
+    mdl, res, terms = aipy_clean(im, ker)
+    _mdl, _res = du.hogbom(im, ker)
+
+    assert np.isnan(res[::2]).all()
+    assert_within_peak(_mdl, mdl, im)
+    assert_within_peak(_res, res, im)
+
+def test_hogbom_diverging_rows():
+    im, ker = delay_rows(20, seed=2)
+    rng = np.random.RandomState(3)
+    ker[::4] = rng.randn(5, NCHAN) + 1j * rng.randn(5, NCHAN)
+    mdl, res, terms = aipy_clean(im, ker)
+    _mdl, _res = du.hogbom(im, ker)
+
+    assert 'divergence' in terms
+    assert_within_peak(_mdl, mdl, im)
+    assert_within_peak(_res, res, im)
+
+def test_deconvolve_parallel_matches_serial():
+    im, ker = delay_rows(8 * 5, seed=4)
+    im, ker = im.reshape(8, 5, NCHAN), ker.reshape(8, 5, NCHAN)
+    for backend in ('aipy', 'numpy'):
+        _dw = im.copy()
+        res = du.deconvolve(_dw, ker, nproc=1, backend=backend)
+        _dw_par = im.copy()
+        res_par = du.deconvolve(_dw_par, ker, nproc=3, chunk_size=7, backend=backend)
+
+        assert np.array_equal(_dw_par, _dw)
+        assert np.array_equal(res_par, res)
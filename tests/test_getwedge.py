@@ -0,0 +1,73 @@
+import json, os, subprocess, sys
+import pytest
+
+GETWEDGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'wedgie', 'getWedge.py')
+
+def step_run(synth_data, out_dir, manifest):
+    """
+    Runs getWedge.py one xx file per --step job over the synthetic data in out_dir and
+    returns what it prints.
+    """
+    files, ex_ants = synth_data
+    command = [sys.executable, GETWEDGE, '-F'] + files[0] + ['-P', 'xx', '-r', '0_32', '-x', ','.join(map(str, ex_ants)), '-s', '1', '-L', '2', '-m', manifest]
+    return subprocess.check_output(command, cwd=out_dir, stderr=subprocess.STDOUT)
+
+def npz_mtimes(out_dir):
+    return dict((name, os.path.getmtime(os.path.join(out_dir, name))) for name in os.listdir(out_dir) if name.endswith('.npz'))
+
+@pytest.fixture
+def step_dir(synth_data, tmpdir):
+    """
+    A directory holding the npz files and manifest of a finished --step run, one job per
+    file of the synthetic data.
+    """
+    out_dir, manifest = str(tmpdir), str(tmpdir.join('manifest.json'))
+    output = step_run(synth_data, out_dir, manifest)
+    assert output.count('Started') == len(synth_data[0][0])
+    return out_dir, manifest
+
+def test_rerun_skips_done_jobs(synth_data, step_dir):
+    out_dir, manifest = step_dir
+    with open(manifest) as f:
+        entries = json.load(f)
+    assert sorted(entries) == sorted(synth_data[0][0])
+    for entry in entries.values():
+        assert entry['status'] == 'done'
+        assert all(os.path.exists(os.path.join(out_dir, npz)) for npz in entry['outputs'])
+
+    mtimes = npz_mtimes(out_dir)
+    output = step_run(synth_data, out_dir, manifest)
+    assert output.count('Skipping') == len(entries)
+    assert 'Started' not in output
+    assert npz_mtimes(out_dir) == mtimes
+
+def test_rerun_partial_manifest(synth_data, step_dir):
+    out_dir, manifest = step_dir
+    with open(manifest) as f:
+        entries = json.load(f)
+
+    # One job missing from the manifest, one whose npz file is gone, one malformed.
+    files = synth_data[0][0]
+    del entries[files[0]]
+    os.remove(os.path.join(out_dir, entries[files[1]]['outputs'][0]))
+    entries[files[2]] = 'done'
+    with open(manifest, 'w') as f:
+        json.dump(entries, f)
+
+    output = step_run(synth_data, out_dir, manifest)
+    assert output.count('Started') == 3
+    with open(manifest) as f:
+        assert all(entry['status'] == 'done' for entry in json.load(f).values())
+
+def test_rerun_corrupted_manifest(synth_data, step_dir):
+    out_dir, manifest = step_dir
+    with open(manifest) as f:
+        text = f.read()
+    with open(manifest, 'w') as f:
+        f.write(text[:len(text) // 2])
+
+    output = step_run(synth_data, out_dir, manifest)
+    assert 'Ignoring unreadable manifest' in output
+    assert output.count('Started') == len(synth_data[0][0])
+    with open(manifest) as f:
+        assert sorted(json.load(f)) == sorted(synth_data[0][0])
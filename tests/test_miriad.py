@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+import miriad_utils as mu
+import vis_utils as vu
+
+def read_all(files, chans, pairs=None):
+    records = list(mu.read_records(files, chans=chans, pairs=pairs))
+    return [record[:4] for record in records], np.array([record[4] for record in records]), np.array([record[5] for record in records])
+
+def assert_same_records(a, b):
+    assert a[0] == b[0]
+    np.testing.assert_array_equal(a[1], b[1])
+    np.testing.assert_array_equal(a[2], b[2])
+
+def test_read_records_pairs(synth_data, monkeypatch):
+    files, ex_ants = synth_data
+    chans = slice(4, 20)
+    records = read_all(files[0][:2], chans)
+    all_pairs = sorted(set(record[2] for record in records[0]))
+    ants = sorted(set(ant for pair in all_pairs for ant in pair))
+
+    # Some of the pairs among some of the antennae, and some of the pairs among them all.
+    for pairs in ([pair for pair in all_pairs if set(pair) < set(ants[:4])][::2], all_pairs[::2]):
+        assert len(pairs) > 1
+        keep = [index for index, record in enumerate(records[0]) if record[2] in pairs]
+        expected = [records[0][index] for index in keep], records[1][keep], records[2][keep]
+
+        # Selected pair by pair, then antenna by antenna.
+        for max_select in (len(pairs), len(pairs) - 1):
+            monkeypatch.setattr(mu, 'MAX_SELECT', max_select)
+            assert_same_records(read_all(files[0][:2], chans, pairs), expected)
+
+def test_read_vis_no_records(synth_data):
+    files, ex_ants = synth_data
+    with pytest.raises(ValueError, match='yy'):
+        mu.read_vis([files[0][:1]], ['yy'])
+
+def assert_same_vis(a, b):
+    assert a.pols == b.pols
+    for name in ('data', 'flags', 'pairs', 'times', 'lsts', 'freqs', 'chans'):
+        np.testing.assert_array_equal(getattr(a, name), getattr(b, name), err_msg=name)
+
+@pytest.mark.parametrize('pols', [['xx'], ['xx', 'yy']])
+@pytest.mark.parametrize('chans', [None, slice(4, 20)])
+def test_from_triple(synth_data, pols, chans):
+    files, ex_ants = synth_data
+    pol_files = [files[['xx', 'xy', 'yx', 'yy'].index(pol)][:2] for pol in pols]
+    all_pairs = mu.read_vis(pol_files, pols, chans).pairs.tolist()
+    pairs = [tuple(pair) for pair in all_pairs[::2]]
+
+    # The triple of every pol's files read at once, as capo.miriad.read_files returns it.
+    triple = mu.read_files([name for names in pol_files for name in names], chans=chans, pairs=pairs)
+    assert_same_vis(vu.Visibilities.from_triple(*triple, pairs=pairs, pols=pols, chans=chans), mu.read_vis(pol_files, pols, chans, pairs))
@@ -0,0 +1,41 @@
+import numpy as np
+import npz_utils as nu
+
+def legacy_meta():
+    """
+    Returns the metadata of a flavors npz file, as getWedge saved it before the JSON
+    metadata.
+    """
+    slopedict = {14.6: {0.0: [(9, 20)], 1.73205: [(9, 22), (10, 43)]}, 29.2: {-0.0: [(10, 22)]}}
+    pairs = {(9, 20): (14.6, 0.0), (9, 22): (14.6, 1.73205), (10, 43): (14.6, 1.73205), (10, 22): (29.2, -0.0)}
+    history = {'filenames': ['zen.2457746.16693.xx.HH.uvcOR'], 'freq_range': '0_32', 'ex_ants': None}
+    return {'pol': 'xx', 'prs': pairs, 'slpdct': slopedict, 'lst': [1.25, 1.5], 'hist': history}
+
+def test_legacy_npz(tmpdir):
+    npz_name = str(tmpdir.join('zen.2457746.16693_16693.xx.HH.uvcOR.0_32.flavors.npz'))
+    wedgeslices = np.random.RandomState(0).rand(3, 32)
+    delays, baselines, slopes = np.linspace(-160, 150, 32), [14.6, 29.2], [-0.0, 0.0, 1.73205]
+    meta = legacy_meta()
+    np.savez(npz_name, wdgslc=wedgeslices, dlys=delays, bls=baselines, slps=slopes, **meta)
+
+    with nu.load(npz_name) as data:
+        assert sorted(data.keys()) == sorted(['wdgslc', 'dlys', 'bls', 'slps'] + list(meta))
+        assert 'meta' not in data
+        for key, value in meta.items():
+            assert data[key] == value, key
+        assert type(data['pol']) == str
+        np.testing.assert_array_equal(data['wdgslc'], wedgeslices)
+        np.testing.assert_array_equal(data['dlys'], delays)
+        np.testing.assert_array_equal(data['bls'], baselines)
+
+def test_legacy_matches_json(tmpdir):
+    legacy_name, json_name = str(tmpdir.join('legacy.npz')), str(tmpdir.join('json.npz'))
+    meta, wedgeslices = legacy_meta(), np.arange(12.).reshape(3, 4)
+    np.savez(legacy_name, wdgslc=wedgeslices, **meta)
+    nu.save(json_name, meta, wdgslc=wedgeslices)
+
+    with nu.load(legacy_name) as legacy, nu.load(json_name) as data:
+        assert sorted(legacy.keys()) == sorted(data.keys())
+        for key in meta:
+            assert legacy[key] == data[key], key
+        np.testing.assert_array_equal(legacy['wdgslc'], data['wdgslc'])
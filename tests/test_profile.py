@@ -0,0 +1,74 @@
+import json
+import pytest
+import wedge_utils as wu
+import profile_utils as pu
+from conftest import CALFILE
+from test_wedges import run_wedge, assert_same_npzs
+
+# Stages that run one redundant group at a time under --profile.
+GROUP_STAGES = ['fft', 'clean', 'multiply']
+
+@pytest.fixture
+def profiling(monkeypatch, tmpdir):
+    """
+    Gives one test fresh stats to profile into, turning profiling off again after it, and
+    returns the name of its report.
+    """
+    monkeypatch.setattr(pu, 'ENABLED', False)
+    monkeypatch.setattr(pu, 'STATS', {})
+    monkeypatch.setattr(pu, 'GROUPS', {})
+    monkeypatch.setattr(pu, 'SPOOL', None)
+    return str(tmpdir.join('run.profile.json'))
+
+def group_labels(mode, ex_ants):
+    """
+    Returns the labels of the redundant groups of mode: baseline lengths, flavors or the
+    antenna pairs of the shortest baseline.
+    """
+    antdict, slopedict = wu.get_baselines(CALFILE, ex_ants)[:2]
+    if mode == 'flavors':
+        keys = [(baseline, slope) for baseline in slopedict for slope in slopedict[baseline]]
+    elif mode == 'bltype':
+        keys = antdict[sorted(antdict.keys())[0]]
+    else:
+        keys = antdict.keys()
+    return set(pu.group_label(key) for key in keys)
+
+@pytest.mark.parametrize('mode, options, pols', [
+    ('timeavg', {}, ['xx']),
+    ('flavors', {}, ['xx']),
+    ('bltype', {}, ['xx']),
+    ('timeavg', {'dly_cache': 'dly'}, ['xx']),
+    ('stokes', {'nproc': 2}, ['stokes' + pol for pol in wu.STOKES]),
+])
+def test_report_by_group(tmpdir, synth_data, profiling, capsys, mode, options, pols):
+    if 'dly_cache' in options:
+        options = dict(options, dly_cache=str(tmpdir.join(options['dly_cache'])))
+    reference = run_wedge(str(tmpdir.join('reference')), mode, synth_data)
+    pu.enable()
+    with pu.context(pol='stokes' if mode == 'stokes' else 'xx', mode=mode):
+        profiled = run_wedge(str(tmpdir.join('profiled')), mode, synth_data, **options)
+    assert_same_npzs(reference, profiled)
+
+    capsys.readouterr()
+    profile = pu.report(profiling, 1.)
+    with open(profiling) as f:
+        assert json.load(f) == json.loads(json.dumps(profile))
+
+    labels = group_labels(mode, synth_data[1])
+    for name in GROUP_STAGES:
+        entries = [entry for entry in profile['stages'] if entry['stage'] == name]
+        assert all(entry['mode'] == mode for entry in entries)
+        for pol in pols:
+            assert set(entry['group'] for entry in entries if entry['pol'] == pol) == labels
+
+    # One row of the table per entry, the stages outside any group shown as '-'.
+    lines = capsys.readouterr()[0].splitlines()
+    assert lines[0].split()[:4] == ['stage', 'pol', 'mode', 'group']
+    rows = [line.split() for line in lines[1:len(profile['stages']) + 1]]
+    assert [row[:4] for row in rows] == [[entry['stage'], str(entry['pol']), mode, entry['group'] or '-'] for entry in profile['stages']]
+    assert any(row[3] == '-' for row in rows)
+
+def test_no_groups_when_off():
+    assert not pu.ENABLED
+    assert pu.group_rows([(0, 1)]) is None
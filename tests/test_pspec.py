@@ -0,0 +1,39 @@
+import numpy as np
+import wedge_utils as wu
+import pspec_utils as pu
+import stats_utils as su
+
+FREQS = np.linspace(0.1, 0.2, 32, endpoint=False)
+
+def bltype_npz(tmpdir):
+    """
+    Saves the wedge of two antenna pairs of one baseline length, over three times, as
+    getWedge saves a bltype npz file. Returns its name, wedge and baseline length.
+    """
+    antdict = {14.6: [(0, 1), (1, 2)], 29.2: [(0, 2)]}
+    antpairslc = np.log10(np.random.RandomState(0).rand(2, 3, len(FREQS)))
+    npz_name = str(tmpdir.join('zen.2457746.16693_16817.xx.HH.uvcOR.0_32.bl_1.npz'))
+    wu.save_bltype(npz_name, FREQS, 'xx', antpairslc, 1, (antdict,), {'filenames': ['a', 'b']})
+
+    return npz_name, antpairslc, 14.6
+
+def test_kbin_bltype(tmpdir):
+    npz_name, antpairslc, length = bltype_npz(tmpdir)
+    kpr_edges, kpl_edges = pu.get_edges(npz_name, 4, 8)
+    pspec, counts = pu.bin_npzs([npz_name], kpr_edges, kpl_edges)
+
+    kpr_per_m = pu.k_factors(FREQS)[0]
+    assert np.isclose(kpr_edges[-1], length * kpr_per_m * 1.05)
+
+    sums, _counts = pu.bin_wedge(antpairslc, [length, length], FREQS, kpr_edges, kpl_edges)
+    assert counts.sum() == antpairslc.size
+    np.testing.assert_array_equal(counts, _counts)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        np.testing.assert_array_equal(pspec, sums / _counts)
+
+def test_stats_bltype(tmpdir):
+    npz_name, antpairslc, length = bltype_npz(tmpdir)
+    stats = dict(zip([name for name, dtype in su.STATS_DTYPE], su.npz_stats(npz_name)))
+
+    assert stats['count_in'] + stats['count_out'] == antpairslc.size
+    assert stats['num_files'] == 2
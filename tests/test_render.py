@@ -0,0 +1,39 @@
+import os
+import pytest
+import numpy as np
+import render_utils as ru
+import stats_utils as su
+from test_wedges import run_wedge
+
+@pytest.fixture(scope='module')
+def npz_names(synth_data, tmpdir_factory):
+    """
+    The npz files of every kind of plot, from the synthetic data.
+    """
+    out_dir = str(tmpdir_factory.mktemp('npzs'))
+    for mode in ('timeavg', 'blavg', 'flavors', 'bltype'):
+        npzs = run_wedge(out_dir, mode, synth_data)
+    return [os.path.join(out_dir, name) for name in sorted(npzs)]
+
+def test_render_batch_out_dir(npz_names, tmpdir):
+    assert sorted(ru.npz_kind(npz_name) for npz_name in npz_names) == ['blavg', 'bltype', 'flavors', 'timeavg']
+    out_dir = str(tmpdir.join('pngs', 'batch'))
+    results = ru.render_batch(npz_names, nproc=2, out_dir=out_dir)
+
+    assert [npz_name for npz_name, png, status in results] == npz_names
+    assert [status for npz_name, png, status in results] == ['rendered'] * len(npz_names)
+    assert sorted(os.listdir(out_dir)) == sorted(os.path.basename(png) for npz_name, png, status in results)
+
+    # Every png is now newer than its npz.
+    results = ru.render_batch(npz_names, nproc=2, out_dir=out_dir)
+    assert [status for npz_name, png, status in results] == ['skipped'] * len(npz_names)
+
+def test_pooled_matches_serial(npz_names, tmpdir):
+    serial = ru.render_batch(npz_names, nproc=1, out_dir=str(tmpdir.join('serial')))
+    pooled = ru.render_batch(npz_names, nproc=3, out_dir=str(tmpdir.join('pooled')))
+    assert [status for npz_name, png, status in pooled] == [status for npz_name, png, status in serial]
+
+    table = su.stats_table(npz_names, buffer=10.)
+    assert list(table['npz']) == npz_names
+    for name in table.dtype.names:
+        np.testing.assert_array_equal(su.stats_table(npz_names, buffer=10., nproc=3)[name], table[name])
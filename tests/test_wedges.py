@@ -0,0 +1,196 @@
+import argparse, glob, os
+import numpy as np
+import pytest
+import aipy
+import wedge_utils as wu
+import synth_utils as syn
+import npz_utils as nu
+from conftest import CALFILE, NCHAN, NFILES, NTIMES
+
+MODES = ['timeavg', 'blavg', 'flavors', 'bltype', 'stokes']
+
+# Options that change how a wedge mode runs, but not what it saves.
+VARIANTS = [
+    {'stream': 1},
+    {'stream': 2},
+    {'nproc': 2},
+]
+
+def wedge_args(**options):
+    """
+    Returns the options of getWedge.py that the wedge modes read, at their defaults.
+    """
+    args = dict(nproc=1, clean_backend='aipy', stream=None, stair=False, dly_cache=None, cache_size=10., aa_cache=None, lags='1', stride=2, bl_num=None, blavg=False, flavors=False)
+    args.update(options)
+    return argparse.Namespace(**args)
+
+def run_wedge(out_dir, mode, synth_data, freq_ranges=((0, NCHAN),), **options):
+    """
+    Runs mode over the synthetic data in out_dir and returns the contents of every npz
+    file it saves, keyed on name.
+    """
+    files, ex_ants = synth_data
+    args, history, freq_ranges = wedge_args(**options), {'filenames': files[0]}, list(freq_ranges)
+
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    cwd = os.getcwd()
+    os.chdir(out_dir)
+    try:
+        if mode == 'stokes':
+            wu.wedge_stokes(args, files, CALFILE, history, freq_ranges, ex_ants)
+        elif mode == 'bltype':
+            args.bl_num = 1
+            wu.wedge_bltype(args, files[0], 'xx', CALFILE, history, freq_ranges, ex_ants)
+        else:
+            getattr(wu, 'wedge_' + mode)(args, files[0], 'xx', CALFILE, history, freq_ranges, ex_ants)
+    finally:
+        os.chdir(cwd)
+
+    return dict((os.path.basename(name), npz_contents(name)) for name in glob.glob(os.path.join(out_dir, '*.npz')))
+
+def first_files(synth_data, nfiles):
+    files, ex_ants = synth_data
+    return [pol_files[:nfiles] for pol_files in files], ex_ants
+
+def wedge(npz):
+    return npz['wdgslc' if 'wdgslc' in npz else 'antpairslc']
+
+def npz_contents(npz_name):
+    with nu.load(npz_name) as data:
+        return dict((key, data[key] if key in nu.METADATA else np.array(data[key])) for key in data.keys())
+
+# Least fraction of finite values in the wedge of every reference npz file, so that
+# the comparisons are not of NaN with NaN.
+MIN_FINITE = 0.9
+
+def assert_same_npzs(npzs, reference):
+    assert sorted(npzs) == sorted(reference)
+    for name in reference:
+        assert np.isfinite(wedge(reference[name])).mean() >= MIN_FINITE, name
+        assert sorted(npzs[name]) == sorted(reference[name]), name
+        for key, value in reference[name].items():
+            if isinstance(value, dict):
+                assert npzs[name][key] == value, (name, key)
+            else:
+                np.testing.assert_array_equal(npzs[name][key], value, err_msg='{} {}'.format(name, key))
+
+@pytest.fixture(scope='module', params=MODES)
+def mode(request):
+    return request.param
+
+@pytest.fixture(scope='module')
+def reference(mode, synth_data, tmpdir_factory):
+    """
+    The npz files of a plain, serial run of mode over every file at once.
+    """
+    return run_wedge(str(tmpdir_factory.mktemp('reference')), mode, synth_data)
+
+@pytest.mark.parametrize('options', VARIANTS, ids=lambda options: ','.join('{}={}'.format(*item) for item in sorted(options.items())))
+def test_variant_matches_reference(mode, reference, synth_data, tmpdir, options):
+    assert reference
+    assert_same_npzs(run_wedge(str(tmpdir), mode, synth_data, **options), reference)
+
+@pytest.fixture(scope='module')
+def dly_cache(tmpdir_factory):
+    """
+    Delay spectrum cache shared by every mode, so that later modes read what earlier
+    ones CLEANed.
+    """
+    return str(tmpdir_factory.mktemp('dly_cache'))
+
+def test_dly_cache_matches_reference(mode, reference, synth_data, dly_cache, tmpdir):
+    # The files only hold some of the antennae of the calfile, the rest being excluded.
+    files, ex_ants = synth_data
+    pairs = wu.get_baselines(CALFILE, ex_ants)[2]
+    for run in ('first', 'second'):
+        assert_same_npzs(run_wedge(str(tmpdir.join(run)), mode, synth_data, dly_cache=dly_cache), reference)
+
+    # Only the pairs of the run are CLEANed and kept.
+    for entry in glob.glob(os.path.join(dly_cache, '*.npz')):
+        assert np.load(entry)['mdl'].shape[1] == len(pairs)
+
+# The flags of every new file raise the CLEAN gains, so that --stair refolds every
+# prefix; with the gains fixed it extends the previous one.
+@pytest.mark.parametrize('data,nfolds', [('synth_data', NFILES * (NFILES + 1) // 2), ('fixed_gain_data', NFILES)])
+def test_stair_matches_prefix_runs(mode, data, nfolds, request, tmpdir, monkeypatch):
+    synth_data = request.getfixturevalue(data)
+    prefixes = {}
+    for nfiles in range(1, NFILES + 1):
+        prefixes.update(run_wedge(str(tmpdir.join(str(nfiles))), mode, first_files(synth_data, nfiles)))
+
+    assert len(prefixes) == NFILES * (4 if mode == 'stokes' else 1)
+    for npz in prefixes.values():
+        assert np.isfinite(wedge(npz)).any()
+
+    folds, fold_window = [], wu.fold_window
+    monkeypatch.setattr(wu, 'fold_window', lambda *args: folds.append(args) or fold_window(*args))
+    assert_same_npzs(run_wedge(str(tmpdir.join('stair')), mode, synth_data, stair=True), prefixes)
+    assert len(folds) == nfolds
+
+def gen_phs_products(ftd, pairs, times, aa, freq_range, lags, stride):
+    """
+    Forms the cross-power products of ftd one pair and product at a time, phasing each
+    with aa.gen_phs as getWedge always has, ordered by their later integration.
+    """
+    aa.set_active_pol('xx')
+    zeniths = []
+    for time in times:
+        aa.set_jultime(time)
+        zenith = aipy.phs.RadioFixedBody(aa.sidereal_time(), aa.lat)
+        zenith.compute(aa)
+        zeniths.append(zenith)
+
+    products = sorted((i + lag, i) for lag in lags for i in range(0, len(times) - lag, stride))
+    vissq = np.zeros((len(pairs), len(products), ftd.shape[-1]))
+    for bl, pair in enumerate(pairs):
+        for prod, (j, i) in enumerate(products):
+            phase_correction = np.conj(aa.gen_phs(zeniths[j], *pair)) * aa.gen_phs(zeniths[i], *pair)
+            vissq[bl, prod] = (np.conj(ftd[bl, i]) * ftd[bl, j] * phase_correction[freq_range[0]:freq_range[1]]).real
+
+    return vissq
+
+@pytest.mark.parametrize('lags,stride', [((1,), 2), ((1,), 1), ((1, 2, 5), 1), ((2, 3), 2)])
+def test_cross_multiply_matches_gen_phs(synth_data, lags, stride):
+    files, ex_ants = synth_data
+    aa = wu.get_aa(CALFILE, files[0][0])
+    pairs = wu.get_run_pairs(CALFILE, ex_ants)[::4]
+    # Far enough apart for the phase corrections to turn the products well away from unphased.
+    times = syn.JD_START + 0.01 * np.arange(2 * NTIMES)
+    freq_range = (4, 20)
+
+    rng = np.random.RandomState(0)
+    ftd = rng.randn(len(pairs), len(times), 16) + 1j * rng.randn(len(pairs), len(times), 16)
+    vissq, lst_range = wu.cross_multiply(ftd, pairs, times, aa, freq_range, wu.lag_slices(len(times), lags, stride))
+
+    np.testing.assert_allclose(vissq, gen_phs_products(ftd, pairs, times, aa, freq_range, lags, stride), rtol=1e-9, atol=1e-12)
+
+def test_lags_stream_matches_one_window(mode, synth_data, tmpdir):
+    lags = {'lags': '1,2,5', 'stride': 1}
+    reference = run_wedge(str(tmpdir.join('all')), mode, synth_data, **lags)
+    for stream in (1, 2):
+        assert_same_npzs(run_wedge(str(tmpdir.join(str(stream))), mode, synth_data, stream=stream, **lags), reference)
+
+BANDS = ((0, 16), (8, 24), (0, NCHAN))
+
+def test_bands_match_single_band_runs(mode, synth_data, tmpdir):
+    bands = {}
+    for band in BANDS:
+        bands.update(run_wedge(str(tmpdir.join('{}_{}'.format(*band))), mode, synth_data, freq_ranges=(band,)))
+
+    assert len(bands) == len(BANDS) * (4 if mode == 'stokes' else 1)
+    for options in ({}, {'stream': 1}, {'stair': True}):
+        npzs = run_wedge(str(tmpdir.join('bands')), mode, synth_data, freq_ranges=BANDS, **options)
+        if options.get('stair'):
+            npzs = dict((name, npz) for name, npz in npzs.items() if name in bands)
+        assert_same_npzs(npzs, bands)
+
+def test_bands_dly_cache(mode, synth_data, tmpdir):
+    dly_cache, bands = str(tmpdir.join('dly_cache')), {}
+    for band in BANDS[:2]:
+        bands.update(run_wedge(str(tmpdir.join('{}_{}'.format(*band))), mode, synth_data, freq_ranges=(band,), dly_cache=dly_cache))
+
+    # Only the band missing from the cache is CLEANed, one entry per file.
+    reference = run_wedge(str(tmpdir.join('reference')), mode, synth_data, freq_ranges=BANDS)
+    assert_same_npzs(run_wedge(str(tmpdir.join('bands')), mode, synth_data, freq_ranges=BANDS, dly_cache=dly_cache), reference)
+    assert len(glob.glob(os.path.join(dly_cache, '*.npz'))) == NFILES * len(BANDS)
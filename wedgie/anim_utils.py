@@ -0,0 +1,81 @@
+"""
+Module for writing animations one frame at a time
+"""
+import threading, Queue
+import imageio
+
+# Marks the end of the frames of prefetch.
+DONE = object()
+
+def anim_name(names, save='./', fmt='gif'):
+    """
+    Returns the animation name for the ordered files names, from the day, the start time
+    of the first and the end time of the last, e.g.
+    "./day2457746__40files__start16693__end16817.gif". The names may be of data files,
+    "zen.2457746.16693.xx.HH.uvcOR", or of npz files (or their pngs), which hold the
+    times they span, "zen.2457746.16693_16817.xx.HH.uvcOR.550_650.timavg.npz".
+    """
+    day = names[0].split('/')[-1].split('.')[1]
+    start = names[0].split('/')[-1].split('.')[2].split('_')[0]
+    end = names[-1].split('/')[-1].split('.')[2].split('_')[-1]
+
+    return "{}day{}__{}files__start{}__end{}.{}".format(save, day, len(names), start, end, fmt)
+
+def get_writer(path, duration=2., fmt='gif'):
+    """
+    Returns an imageio writer that appends frames to path as they come, each shown for
+    duration seconds. 'mp4' needs the ffmpeg plugin of imageio.
+    """
+    if fmt == 'gif':
+        return imageio.get_writer(path, format='GIF', mode='I', duration=duration)
+    return imageio.get_writer(path, format='FFMPEG', mode='I', fps=1. / duration)
+
+def downsample(frame, factor=1):
+    return frame[::factor, ::factor] if factor > 1 else frame
+
+def prefetch(frames, depth=4):
+    """
+    Yields the items of the iterable frames, which are produced up to depth items ahead
+    in a background thread, so that decoding overlaps with encoding.
+    """
+    queue = Queue.Queue(maxsize=depth)
+
+    def produce():
+        try:
+            for frame in frames:
+                queue.put((frame, None))
+        except Exception as error:
+            queue.put((None, error))
+        queue.put((DONE, None))
+
+    thread = threading.Thread(target=produce)
+    thread.daemon = True
+    thread.start()
+
+    while True:
+        frame, error = queue.get()
+        if error is not None:
+            raise error
+        if frame is DONE:
+            break
+        yield frame
+
+def read_frames(images, factor=1):
+    for image in images:
+        yield downsample(imageio.imread(image), factor)
+
+def write_animation(path, frames, duration=2., fmt='gif'):
+    """
+    Appends every frame of the iterable frames to the animation at path, one at a time,
+    and returns the number of frames written.
+    """
+    nframes = 0
+    writer = get_writer(path, duration, fmt)
+    try:
+        for frame in frames:
+            writer.append_data(frame)
+            nframes += 1
+    finally:
+        writer.close()
+
+    return nframes
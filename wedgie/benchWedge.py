@@ -0,0 +1,213 @@
+import argparse, contextlib, json, os, shutil, socket, subprocess, sys, tempfile, time
+import numpy as np
+import wedge_utils as wu
+import synth_utils as syn
+
+MODES = ['timeavg', 'blavg', 'flavors', 'bltype', 'stokes', 'baselines', 'in_out_avg']
+
+parser = argparse.ArgumentParser(description='Times every wedge mode on synthetic miriad files, offline, and appends the results to a JSON lines file.')
+parser.add_argument('-L',
+                    '--layouts',
+                    help='Input a comma-delimited list of antenna layouts: "hsa7458_v001" (its first nants antennae) and/or "hex" (a hexagonal grid of nants antennae).',
+                    default='hsa7458_v001,hex')
+parser.add_argument('-a',
+                    '--nants',
+                    help='Input a comma-delimited list of numbers of antennae.',
+                    default='19,37')
+parser.add_argument('-t',
+                    '--ntimes',
+                    help='Input a comma-delimited list of numbers of integrations per file.',
+                    default='10')
+parser.add_argument('-c',
+                    '--nchan',
+                    help='Input a comma-delimited list of numbers of channels.',
+                    default='64')
+parser.add_argument('-g',
+                    '--flag_frac',
+                    help='Input a comma-delimited list of fractions of samples to flag.',
+                    default='0.1')
+parser.add_argument('-n',
+                    '--nfiles',
+                    help='Number of files of each data set.',
+                    type=int,
+                    default=2)
+parser.add_argument('-m',
+                    '--modes',
+                    help='Input a comma-delimited list of what to time, of: {}.'.format(', '.join(MODES)),
+                    default=','.join(MODES))
+parser.add_argument('-b',
+                    '--bl_num',
+                    help='Baseline type of the bltype mode.',
+                    type=int,
+                    default=1)
+parser.add_argument('-R',
+                    '--repeat',
+                    help='Time every mode this many times and keep the fastest.',
+                    type=int,
+                    default=1)
+parser.add_argument('-o',
+                    '--output',
+                    help='JSON lines file that the results are appended to.',
+                    default='bench_results.jsonl')
+parser.add_argument('-l',
+                    '--label',
+                    help='Label of the results, e.g. a version; defaults to the git commit of the code.')
+parser.add_argument('-C',
+                    '--compare',
+                    help='Input the label of earlier results to compare the throughput of this run to.')
+parser.add_argument('-d',
+                    '--work_dir',
+                    help='Directory to write the synthetic data and npz files to; defaults to a temporary one.')
+parser.add_argument('-k',
+                    '--keep',
+                    help='Keep the synthetic data and npz files.',
+                    action='store_true')
+args = parser.parse_args()
+
+def git_version():
+    try:
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)), stderr=devnull).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+@contextlib.contextmanager
+def quiet():
+    """
+    Silences the progress printed by the wedge modes.
+    """
+    stdout = sys.stdout
+    with open(os.devnull, 'w') as devnull:
+        sys.stdout = devnull
+        try:
+            yield
+        finally:
+            sys.stdout = stdout
+
+def engine_args(bl_num=None):
+    """
+    Returns the options of getWedge.py that the wedge modes read, at their defaults.
+    """
+    return argparse.Namespace(nproc=1, clean_backend='aipy', stream=None, stair=False, dly_cache=None, cache_size=10., aa_cache=None, lags='1', stride=2, bl_num=bl_num, blavg=False, flavors=False)
+
+def make_data(work_dir, layout, nants, ntimes, nchan, flag_frac, pols):
+    """
+    Writes the calfile (for hex layouts) and files of one point of the grid to work_dir.
+    Returns the calfile, the antennae to exclude from it, the antenna positions and the
+    files of every pol.
+    """
+    if layout == 'hsa7458_v001':
+        positions = syn.hsa_positions(nants)
+        calfile = layout
+        ex_ants = sorted(set(syn.hsa_positions()) - set(positions))
+    elif layout == 'hex':
+        positions = syn.hex_positions(nants)
+        calfile = syn.write_calfile(work_dir, 'bench_hex{}'.format(nants), positions)
+        ex_ants = []
+    else:
+        raise ValueError("Unknown layout {}.".format(layout))
+
+    files = syn.write_files(work_dir, positions, args.nfiles, ntimes, nchan, flag_frac, pols)
+    return calfile, ex_ants, positions, files
+
+def run_mode(mode, calfile, ex_ants, files, nchan, history, timeavg_npz=None):
+    """
+    Runs mode once over files and returns the npz file it saves, if any. in_out_avg is
+    run on timeavg_npz.
+    """
+    freq_ranges = [(0, nchan)]
+    if mode == 'timeavg':
+        return wu.wedge_timeavg(engine_args(), files[0], 'xx', calfile, history, freq_ranges, ex_ants)
+    elif mode == 'blavg':
+        return wu.wedge_blavg(engine_args(), files[0], 'xx', calfile, history, freq_ranges, ex_ants)
+    elif mode == 'flavors':
+        return wu.wedge_flavors(engine_args(), files[0], 'xx', calfile, history, freq_ranges, ex_ants)
+    elif mode == 'bltype':
+        return wu.wedge_bltype(engine_args(args.bl_num), files[0], 'xx', calfile, history, freq_ranges, ex_ants)
+    elif mode == 'stokes':
+        return wu.wedge_stokes(engine_args(), files, calfile, history, freq_ranges, ex_ants)
+    elif mode == 'baselines':
+        # Time the redundancy index from scratch, not from the cache of this process.
+        wu.BASELINE_CACHE.clear()
+        wu.get_baselines(calfile, ex_ants)
+    elif mode == 'in_out_avg':
+        wu.in_out_avg(timeavg_npz)
+
+def compare(output, label, results):
+    """
+    Prints the throughput of results relative to the latest results of label in output.
+    """
+    earlier = {}
+    with open(output) as f:
+        for line in f:
+            result = json.loads(line)
+            if result['label'] == label:
+                earlier[result['config']] = result
+
+    print '\nThroughput relative to {}:'.format(label)
+    for result in results:
+        if result['config'] in earlier:
+            print '{:<60} {:>7.2f}x'.format(result['config'], result['throughput'] / earlier[result['config']]['throughput'])
+        else:
+            print '{:<60} {:>8}'.format(result['config'], 'new')
+
+modes = args.modes.split(',')
+label = args.label or git_version()
+work_dir = args.work_dir or tempfile.mkdtemp(prefix='wedgie_bench_')
+if not os.path.isdir(work_dir):
+    os.makedirs(work_dir)
+sys.path.insert(0, work_dir)
+start_dir = os.getcwd()
+output = os.path.abspath(args.output)
+pols = ['xx', 'xy', 'yx', 'yy'] if 'stokes' in modes else ['xx']
+
+results = []
+os.chdir(work_dir)
+try:
+    for layout in args.layouts.split(','):
+        nants_list = map(int, args.nants.split(','))
+        if layout == 'hsa7458_v001':
+            # hsa7458_v001 only has so many antennae.
+            nants_list = sorted(set(min(nants, len(syn.hsa_positions())) for nants in nants_list))
+        for nants in nants_list:
+            for ntimes in map(int, args.ntimes.split(',')):
+                for nchan in map(int, args.nchan.split(',')):
+                    for flag_frac in map(float, args.flag_frac.split(',')):
+                        calfile, ex_ants, positions, files = make_data(work_dir, layout, nants, ntimes, nchan, flag_frac, pols)
+                        nbl = len(positions) * (len(positions) - 1) // 2
+                        history, timeavg_npz = {'filenames': files[0]}, None
+
+                        # Build the AntennaArray once, as a getWedge run shares it between modes.
+                        with quiet():
+                            wu.get_aa(calfile, files[0][0])
+                            if 'in_out_avg' in modes:
+                                timeavg_npz = run_mode('timeavg', calfile, ex_ants, files, nchan, history)
+
+                        for mode in modes:
+                            walls = []
+                            for repeat in range(args.repeat):
+                                with quiet():
+                                    start = time.time()
+                                    run_mode(mode, calfile, ex_ants, files, nchan, history, timeavg_npz)
+                                    walls.append(time.time() - start)
+
+                            # Baseline-integrations of one pol of the data set per second.
+                            config = '{} nants={} ntimes={} nchan={} flags={} {}'.format(layout, len(positions), ntimes * args.nfiles, nchan, flag_frac, mode)
+                            result = {'label': label, 'date': time.strftime('%Y-%m-%dT%H:%M:%S'), 'host': socket.gethostname(), 'numpy': np.__version__,
+                                      'config': config, 'layout': layout, 'nants': len(positions), 'nbl': nbl,
+                                      'ntimes': ntimes * args.nfiles, 'nchan': nchan, 'flag_frac': flag_frac, 'mode': mode,
+                                      'wall': min(walls), 'throughput': nbl * ntimes * args.nfiles / min(walls)}
+                            results.append(result)
+                            print '{:<60} {:>8.3f} s {:>12.0f} bl-int/s'.format(config, result['wall'], result['throughput'])
+finally:
+    os.chdir(start_dir)
+    if not args.keep and not args.work_dir:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if args.compare and os.path.exists(output):
+    compare(output, args.compare, results)
+
+with open(output, 'a') as f:
+    for result in results:
+        f.write(json.dumps(result, sort_keys=True) + '\n')
+print output
@@ -0,0 +1,123 @@
+"""
+Module for the on-disk cache of per-file CLEANed delay spectra, and for writing any
+cache file atomically
+"""
+import os, hashlib, contextlib
+import numpy as np
+
+# File content hashes computed so far in this process, keyed on (path, size, mtime).
+HASH_CACHE = {}
+
+def file_hash(path, block_size=2**20):
+    """
+    Returns the sha1 hex digest of the contents of path. A miriad data set is a directory,
+    so every file under it is hashed, by relative name and contents, in sorted order.
+    """
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime)
+    if key in HASH_CACHE:
+        return HASH_CACHE[key]
+
+    if os.path.isdir(path):
+        names = []
+        for root, dirs, files in os.walk(path):
+            names.extend(os.path.join(root, name) for name in files)
+    else:
+        names = [path]
+
+    sha = hashlib.sha1()
+    for name in sorted(names):
+        sha.update(os.path.relpath(name, path).encode())
+        with open(name, 'rb') as f:
+            for block in iter(lambda: f.read(block_size), b''):
+                sha.update(block)
+
+    HASH_CACHE[key] = sha.hexdigest()
+    return HASH_CACHE[key]
+
+def cache_key(files, *params):
+    """
+    Returns the cache key of the given files (by content) and parameters, e.g. pol,
+    freq_range, window, CLEAN tolerance and calfile. Parameters are hashed by repr.
+    """
+    sha = hashlib.sha1()
+    for file in files:
+        sha.update(file_hash(file).encode())
+    for param in params:
+        sha.update(repr(param).encode())
+
+    return sha.hexdigest()
+
+@contextlib.contextmanager
+def atomic_open(path, mode='wb'):
+    """
+    Opens a temporary file beside path for writing, and renames it to path once the block
+    is done with it, so that readers, in this process or any other, never see half of it.
+    """
+    dir_name = os.path.dirname(path)
+    if dir_name and not os.path.isdir(dir_name):
+        try:
+            os.makedirs(dir_name)
+        except OSError:
+            # Another process got to it first.
+            if not os.path.isdir(dir_name):
+                raise
+
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    try:
+        with open(tmp_path, mode) as f:
+            yield f
+        os.rename(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def load(cache_dir, key):
+    """
+    Returns the (lazily loaded) npz entry of key in cache_dir, or None if there is none.
+    Loading marks the entry as recently used.
+    """
+    path = os.path.join(cache_dir, key + '.npz')
+    if not os.path.exists(path):
+        return None
+
+    os.utime(path, None)
+    return np.load(path)
+
+def save(cache_dir, key, max_size=None, **arrays):
+    """
+    Writes arrays as the uncompressed npz entry of key in cache_dir (see atomic_open),
+    then evicts the least recently used entries until the cache holds at most max_size
+    bytes (if given).
+    """
+    path = os.path.join(cache_dir, key + '.npz')
+    with atomic_open(path) as f:
+        np.savez(f, **arrays)
+
+    if max_size is not None:
+        evict(cache_dir, max_size, keep=path)
+
+def evict(cache_dir, max_size, keep=None):
+    """
+    Removes the least recently used entries of cache_dir, other than keep, until their
+    total size is at most max_size bytes.
+    """
+    entries = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if name.endswith('.npz'):
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for mtime, size, path in entries)
+    for mtime, size, path in sorted(entries):
+        if total <= max_size:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            # Another process got to it first.
+            pass
+        total -= size
@@ -1,5 +1,4 @@
 import numpy as np
-import gen_utils as gu
 from astropy.cosmology import Planck15 as cosmo
 from astropy import units as u
 from astropy import constants as c
@@ -20,13 +19,85 @@ HERA_OP_OPP = 2.175 # See HERA Memo #27
 PAPER_OP_OPP = 2.35
 
 # Cosmology routines
+#
+# Every routine has a fast counterpart (suffix _fast) on plain floats or float arrays in
+# fixed units: frequencies in GHz, lengths in m, distances in Mpc (h^-1 Mpc where noted)
+# and k in h/Mpc. The Quantity routines are thin wrappers around them.
+
+F21 = 1.42040575177 # GHz
+
+# Band of the comoving distance table, in GHz (50-250 MHz covers the HERA band), and its size.
+TABLE_BAND = (0.05, 0.25)
+TABLE_SIZE = 4001
+
+# (redshifts, comoving transverse distances in Mpc), built by comoving_table on first use.
+COMOVING_TABLE = []
+
+def comoving_table():
+    """
+    Returns the table of comoving transverse distance (Mpc) against redshift over
+    TABLE_BAND, integrated by astropy once per process.
+    """
+    if not COMOVING_TABLE:
+        zs = np.linspace(F21 / TABLE_BAND[1] - 1., F21 / TABLE_BAND[0] - 1., TABLE_SIZE)
+        COMOVING_TABLE.extend([zs, cosmo.comoving_transverse_distance(zs).to(u.Mpc).value])
+    return COMOVING_TABLE
+
+def comoving_transverse_distance_fast(z):
+    """
+    Comoving transverse distance in Mpc, interpolated from comoving_table; redshifts
+    outside the table are integrated by astropy.
+    """
+    zs, distances = comoving_table()
+    z = np.asarray(z, dtype=float)
+    distance = np.interp(z, zs, distances)
+
+    outside = (z < zs[0]) | (z > zs[-1])
+    if np.any(outside):
+        distance = np.where(outside, cosmo.comoving_transverse_distance(np.where(outside, z, zs[0])).to(u.Mpc).value, distance)
+    return distance
+
+def f2z_fast(fq):
+    return F21 / np.asarray(fq, dtype=float) - 1.
+
+def f2eta_fast(f):
+    return np.fft.fftfreq(f.shape[-1], f[1]-f[0])
+
+def dL_df_fast(z):
+    return (1.7 / 0.1) * (np.sqrt((1+np.asarray(z))/10.) * (1./np.sqrt(cosmo.Om0/0.15)) * 1e3 )
+
+def dL_dth_fast(z):
+    #0.00291 == aipy.const.arcmin
+    return 1.9 * (1./0.000291) * np.power((1+np.asarray(z))/10.,0.2)
+
+def dk_du_fast(z):
+    return 2*np.pi / dL_dth_fast(z)
+
+def dk_deta_fast(z):
+    return 2*np.pi / dL_df_fast(z)
+
+def eta2kpl_fast(etas,z):
+    return dk_deta_fast(z) * etas
+
+def freq2kpl_fast(freqs,fold=False):
+    # The central frequency of an equally spaced band.
+    cen_fq = (freqs[0] + freqs[-1]) / 2.
+    kpl = np.fft.fftshift(eta2kpl_fast(f2eta_fast(freqs),f2z_fast(cen_fq)))
+    if fold:
+        return kpl[kpl.shape[0]/2:]
+    else:
+        return kpl
+
+def uv2kpr_fast(blmag,cen_fq):
+    lam = c.c.to(u.m/u.s).value / (cen_fq * 1e9)
+    uvmag = np.asarray(blmag) / lam
+    return 2*np.pi*uvmag/(comoving_transverse_distance_fast(f2z_fast(cen_fq))*cosmo.h)
 
 def f2z(fq):
     """
     Convert frequency to redshift for 21cm line.
     """
-    F21 = 1.42040575177*u.GHz
-    return (F21 / fq - 1.)
+    return f2z_fast(fq.to(u.GHz).value) * u.dimensionless_unscaled
 
 def f2eta(f):
     """
@@ -35,33 +106,32 @@ def f2eta(f):
     
     Expects GIGAHERTZ frequencies
     """
-    return np.fft.fftfreq(f.shape[-1], f[1]-f[0])*u.ns
+    return f2eta_fast(f)*u.ns
 
 def dL_df(z):
     """
     [h^-1 Mpc]/GHz, from Furlanetto et al. (2006)
     """
-    return (1.7 / 0.1) * (np.sqrt((1+z)/10.) * (1./np.sqrt(cosmo.Om0/0.15)) * 1e3 ) * u.Mpc/(u.GHz)
+    return dL_df_fast(u.Quantity(z).value) * u.Mpc/(u.GHz)
 
 def dL_dth(z):
     """
     [h^-1 Mpc]/radian, from Furlanetto et al. (2006)
     """
-    #0.00291 == aipy.const.arcmin
-    return 1.9 * (1./0.000291) * np.power((1+z)/10.,0.2) *u.Mpc/(u.radian)
+    return dL_dth_fast(u.Quantity(z).value) *u.Mpc/(u.radian)
 
 def dk_du(z):
     """
     2pi * [h Mpc^-1] / [wavelengths], valid for u >> 1.
     """
     # from du = 1/dth, which derives from du = d(sin(th)) using the small-angle approx
-    return 2*np.pi / dL_dth(z)
+    return dk_du_fast(u.Quantity(z).value) * u.radian/u.Mpc
 
 def dk_deta(z):
     """
     2pi * [h Mpc^-1] / [GHz^-1]
     """
-    return (2*np.pi / dL_df(z)).to(u.GHz/u.Mpc)
+    return dk_deta_fast(u.Quantity(z).value) * u.GHz/u.Mpc
 
 def eta2kpl(etas,z):
     """
@@ -76,14 +146,7 @@ def freq2kpl(freqs,fold=False):
     
     fold=True returns the positive-half of the k_parallel array.
     """
-    cen_fq = gu.findMiddle(freqs)
-    z = f2z(cen_fq)
-    etas = f2eta(freqs)
-    kpl = np.fft.fftshift(eta2kpl(etas,z))
-    if fold:
-        return kpl[kpl.shape[0]/2:]*(1./u.Mpc)
-    else:
-        return kpl*(1./u.Mpc)
+    return freq2kpl_fast(freqs, fold)*(1./u.Mpc)
 
 def uv2kpr(blmag,cen_fq):
     """
@@ -95,9 +158,4 @@ def uv2kpr(blmag,cen_fq):
     
     Returns k_perpendicular in units of h/Mpc
     """
-    z = f2z(cen_fq)
-    lam = c.c/(cen_fq)
-    uvmag = blmag/lam
-    kpr = 2*np.pi*uvmag/(cosmo.comoving_transverse_distance(z)*cosmo.h)
-    return kpr.to(1./u.Mpc)
-    
\ No newline at end of file
+    return uv2kpr_fast(blmag.to(u.m).value, cen_fq.to(u.GHz).value) * (1./u.Mpc)
@@ -1,174 +1,365 @@
-import argparse
-import wedge_utils as wu
-from IPython import embed
-import multiprocessing
-
-parser = argparse.ArgumentParser()
-parser.add_argument('-F',
-                    '--filenames',
-                    help='Input a list of filenames to be analyzed.',
-                    nargs='*',
-                    required=True)
-parser.add_argument('-C',
-                    '--calfile',
-                    help='Input the calfile to be used for analysis.',
-                    default='hsa7458_v001')
-parser.add_argument('-P',
-                    '--pol',
-                    help='Input a comma-delimited list of polatizations to plot.',
-                    default='stokes')
-parser.add_argument('-f',
-                    '--flavors',
-                    help='Toggle splitting wedgeslices into a per slope per baseline basis.',
-                    action='store_true')
-parser.add_argument('-t',
-                    '--time_avg',
-                    help='Toggle off time averaging.',
-                    default=True,
-                    action='store_false')
-parser.add_argument('-x',
-                    '--ex_ants',
-                    help='Input a comma-delimited list of antennae to exclude from analysis.',
-                    type=str)
-parser.add_argument('-s',
-                    '--step',
-                    help='Toggle file stepping.',
-                    type=int)
-parser.add_argument('-L',
-                    '--load',
-                    help='How many processes to run at once.',
-                    type=int,
-                    default=1)
-parser.add_argument('-r',
-                    '--freq_range',
-                    help='Input a range of frequency channels to use separated by an underscore: "550_650"',
-                    default='0_1023')
-parser.add_argument('-a',
-                    '--stair',
-                    help='Compute npz files for 1 file, then 2 files, then 3 files, ...',
-                    action='store_true')
-parser.add_argument('-d',
-                    '--delay_avg',
-                    help="sfsdfasdfsf",
-                    action="store_true")
-parser.add_argument('-b',
-                    '--blavg',
-                    help='Toggle blavg for stokes.',
-                    action='store_true')
-parser.add_argument('-l',
-                    '--bl_num',
-                    help='Toggle bltype and input 1 baseline type.',
-                    type=int)
-args = parser.parse_args()
-
-class Batch:
-    def __init__(self, args):
-        self.args = args
-        self.history = vars(args)
-        
-        self.files = None
-        self.pols = None
-        self.pol_type = None
-        self.calfile = args.calfile.split('.')[0]
-        self.freq_range = (int(args.freq_range.split('_')[0]), int(args.freq_range.split('_')[1]))
-        self.ex_ants = []
-
-        # Generate ex_ants list from args.ex_ants.
-        if args.ex_ants is not None:
-            self.ex_ants = map(int, args.ex_ants.split(','))
-
-        # Format the polarizations to be used from args.pol.
-        self.pols = [pol.lower() for pol in self.args.pol.split(',')]
-        num_pols = len(self.pols)
-
-        if self.pols == ['stokes']:
-            self.pols = ['xx','xy','yx','yy']
-            self.pol_type = 'stokes'
-        elif num_pols == 1:
-            self.pol_type = 'single'
-        elif num_pols > 1:
-            self.pol_type = 'multi'
-
-        # Generates correct file names depending on polarization chosen and files given.
-        self.files = []
-        for pol in self.pols:
-
-            pol_files = []
-            for file in self.args.filenames:
-                file_pol = file.split('.')[-3]
-                new_file = file.split(file_pol)[0] + pol + file.split(file_pol)[1]
-
-                if not new_file in pol_files:
-                    pol_files.append(new_file)
-
-            self.files.append(pol_files)
-
-    def __repr__(self):
-        return str(self.history)
-
-    def logic(self):
-        if self.pol_type == 'stokes':
-                wu.wedge_stokes(self.args, self.files, self.calfile, self.history, self.freq_range, self.ex_ants)
-
-        elif self.pol_type == 'multi':
-            for i in range(len(pols)):
-                if self.args.flavors:
-                    wu.wedge_flavors(self.args, self.files[i], self.pols[i], self.calfile, self.history, self.freq_range, self.ex_ants)
-                elif self.args.time_avg:
-                    wu.wedge_timeavg(self.args, self.files[i], self.pols[i], self.calfile, self.history, self.freq_range, self.ex_ants)
-
-        elif self.pol_type == 'single':
-            if self.args.delay_avg:
-                for file in self.files[0]:
-                    wu.wedge_delayavg(file)
-            elif self.args.flavors:
-                wu.wedge_flavors(self.args, self.files[0], self.pols[0], self.calfile, self.history, self.freq_range, self.ex_ants)
-            elif self.args.time_avg:
-                wu.wedge_timeavg(self.args, self.files[0], self.pols[0], self.calfile, self.history, self.freq_range, self.ex_ants)
-            else:
-                wu.wedge_blavg(self.args, self.files[0], self.pols[0], self.calfile, self.history, self.freq_range, self.ex_ants)
-
-if args.step is not None:
-    step, files = args.step, args.filenames
-    del args.step, args.filenames
-
-    files_xx = [file for file in files if 'xx' in file]
-    num_files_xx = len(files_xx)
-
-    count = 1
-    for index in range(0, num_files_xx, step):
-        args.filenames = files_xx[index : index + step]
-        zen = Batch(args)
-
-        if count % args.load:
-            multiprocessing.Process(target=zen.logic).start()
-        else:
-            zen.logic()
-
-        count += 1
-
-    print 'Step program complete.'
-
-elif args.stair:
-    files = args.filenames
-    del args.filenames
-
-    files_xx = [file for file in files if 'xx' in file]
-    num_files_xx = len(files_xx)
-
-    count = 1
-    for index in range(1, num_files_xx):
-        args.filenames = files_xx[0: index]
-        zen = Batch(args)
-        
-        if count % args.load:
-            multiprocessing.Process(target=zen.logic).start()
-        else:
-            zen.logic()
-
-        count += 1
-    print 'Stair program complete.'
-
-else:
-    zen = Batch(args)
+import argparse
+import wedge_utils as wu
+import miriad_utils as mu
+import cache_utils as ch
+import profile_utils as pu
+from IPython import embed
+import multiprocessing
+import copy, json, os, time
+
+parser = argparse.ArgumentParser()
+parser.add_argument('-F',
+                    '--filenames',
+                    help='Input a list of filenames to be analyzed.',
+                    nargs='*',
+                    required=True)
+parser.add_argument('-C',
+                    '--calfile',
+                    help='Input the calfile to be used for analysis.',
+                    default='hsa7458_v001')
+parser.add_argument('-P',
+                    '--pol',
+                    help='Input a comma-delimited list of polatizations to plot.',
+                    default='stokes')
+parser.add_argument('-f',
+                    '--flavors',
+                    help='Toggle splitting wedgeslices into a per slope per baseline basis.',
+                    action='store_true')
+parser.add_argument('-t',
+                    '--time_avg',
+                    help='Toggle off time averaging.',
+                    default=True,
+                    action='store_false')
+parser.add_argument('-x',
+                    '--ex_ants',
+                    help='Input a comma-delimited list of antennae to exclude from analysis.',
+                    type=str)
+parser.add_argument('-s',
+                    '--step',
+                    help='Toggle file stepping.',
+                    type=int)
+parser.add_argument('-L',
+                    '--load',
+                    help='How many processes to run at once.',
+                    type=int,
+                    default=1)
+parser.add_argument('-r',
+                    '--freq_range',
+                    help='Input a range of frequency channels to use separated by an underscore: "550_650", or several comma-delimited ranges to make each from one read of the files: "550_650,650_750"',
+                    default='0_1023')
+parser.add_argument('-a',
+                    '--stair',
+                    help='Compute npz files for 1 file, then 2 files, then 3 files, ...',
+                    action='store_true')
+parser.add_argument('-d',
+                    '--delay_avg',
+                    help="sfsdfasdfsf",
+                    action="store_true")
+parser.add_argument('-b',
+                    '--blavg',
+                    help='Toggle blavg for stokes.',
+                    action='store_true')
+parser.add_argument('-l',
+                    '--bl_num',
+                    help='Toggle bltype and input 1 baseline type.',
+                    type=int)
+parser.add_argument('-A',
+                    '--aa_cache',
+                    help='Input a directory in which to keep pickled AntennaArrays and baseline indices, so that new processes start warm.',
+                    default=None)
+parser.add_argument('-n',
+                    '--nproc',
+                    help='How many processes to CLEAN with.',
+                    type=int,
+                    default=1)
+parser.add_argument('-K',
+                    '--clean_backend',
+                    help='CLEAN implementation: "aipy" (one row per call) or "numpy" (blocks of rows at once).',
+                    choices=['aipy', 'numpy'],
+                    default='aipy')
+parser.add_argument('-S',
+                    '--stream',
+                    help='Read and reduce this many files at a time, rather than all of them at once.',
+                    type=int)
+parser.add_argument('-D',
+                    '--dly_cache',
+                    help='Input a directory in which to cache CLEANed delay spectra per file, so that other wedge modes over the same files skip the CLEAN.',
+                    default=None)
+parser.add_argument('-Z',
+                    '--cache_size',
+                    help='Largest size of the delay spectrum cache in GB; the least recently used files are evicted past it.',
+                    type=float,
+                    default=10.)
+parser.add_argument('-M',
+                    '--max_mem',
+                    help='Memory in GB that the --step jobs may use at once (by their estimates); defaults to the available memory.',
+                    type=float)
+parser.add_argument('-m',
+                    '--manifest',
+                    help='Input a JSON file recording the --step jobs that have finished, so that a rerun skips them.',
+                    default=None)
+parser.add_argument('-T',
+                    '--lags',
+                    help='Input a comma-delimited list of integration lags to form cross-power products at: "1,2"',
+                    default='1')
+parser.add_argument('-I',
+                    '--stride',
+                    help='Start a product at every stride-th integration: 2 pairs (0,1), (2,3), ...; 1 interleaves (0,1), (1,2), ...',
+                    type=int,
+                    default=2)
+parser.add_argument('-p',
+                    '--profile',
+                    help='Time every stage (reading, calfile, AntennaArray, FFT, CLEAN, LST/phase, products, saving), write a JSON report next to the npz files and print a summary.',
+                    action='store_true')
+args = parser.parse_args()
+
+# Rough peak memory of a job as a multiple of the visibility data it holds at once:
+# the read dictionaries, the stacked arrays and the CLEAN models and residuals.
+MEMORY_FACTOR = 8
+
+class Batch:
+    def __init__(self, args):
+        self.args = args
+        self.history = vars(args)
+        
+        self.files = None
+        self.pols = None
+        self.pol_type = None
+        self.calfile = args.calfile.split('.')[0]
+        self.freq_ranges = [(int(band.split('_')[0]), int(band.split('_')[1])) for band in args.freq_range.split(',')]
+        self.ex_ants = []
+
+        # Generate ex_ants list from args.ex_ants.
+        if args.ex_ants is not None:
+            self.ex_ants = map(int, args.ex_ants.split(','))
+
+        # Format the polarizations to be used from args.pol.
+        self.pols = [pol.lower() for pol in self.args.pol.split(',')]
+        num_pols = len(self.pols)
+
+        if self.pols == ['stokes']:
+            self.pols = ['xx','xy','yx','yy']
+            self.pol_type = 'stokes'
+        elif num_pols == 1:
+            self.pol_type = 'single'
+        elif num_pols > 1:
+            self.pol_type = 'multi'
+
+        # Generates correct file names depending on polarization chosen and files given.
+        self.files = []
+        for pol in self.pols:
+
+            pol_files = []
+            for file in self.args.filenames:
+                file_pol = file.split('.')[-3]
+                new_file = file.split(file_pol)[0] + pol + file.split(file_pol)[1]
+
+                if not new_file in pol_files:
+                    pol_files.append(new_file)
+
+            self.files.append(pol_files)
+
+    def __repr__(self):
+        return str(self.history)
+
+    def logic(self):
+        if not self.args.profile:
+            return self.run()
+
+        pu.enable()
+        start = time.time()
+        with pu.context(pol='stokes' if self.pol_type == 'stokes' else self.pols[0], mode=self.mode()):
+            self.run()
+        pu.report(self.profile_name(), time.time() - start, self.history)
+
+    def run(self):
+        if self.pol_type == 'stokes':
+                wu.wedge_stokes(self.args, self.files, self.calfile, self.history, self.freq_ranges, self.ex_ants)
+
+        elif self.pol_type == 'multi':
+            for i in range(len(self.pols)):
+                with pu.context(pol=self.pols[i]):
+                    if self.args.flavors:
+                        wu.wedge_flavors(self.args, self.files[i], self.pols[i], self.calfile, self.history, self.freq_ranges, self.ex_ants)
+                    elif self.args.time_avg:
+                        wu.wedge_timeavg(self.args, self.files[i], self.pols[i], self.calfile, self.history, self.freq_ranges, self.ex_ants)
+
+        elif self.pol_type == 'single':
+            if self.args.delay_avg:
+                for file in self.files[0]:
+                    wu.wedge_delayavg(file)
+            elif self.args.flavors:
+                wu.wedge_flavors(self.args, self.files[0], self.pols[0], self.calfile, self.history, self.freq_ranges, self.ex_ants)
+            elif self.args.time_avg:
+                wu.wedge_timeavg(self.args, self.files[0], self.pols[0], self.calfile, self.history, self.freq_ranges, self.ex_ants)
+            else:
+                wu.wedge_blavg(self.args, self.files[0], self.pols[0], self.calfile, self.history, self.freq_ranges, self.ex_ants)
+
+    def mode(self):
+        if self.args.flavors:
+            return 'flavors'
+        elif self.pol_type == 'stokes':
+            if self.args.blavg:
+                return 'blavg'
+            elif self.args.bl_num:
+                return 'bl_{}'.format(self.args.bl_num)
+            return 'timeavg'
+        elif self.args.time_avg:
+            return 'timavg'
+        return 'blavg'
+
+    def profile_name(self):
+        """
+        Returns the name of the --profile report, e.g. "zen.2457746.16693_16817.xx.HH.uvcOR.550_650.timavg.profile.json".
+        """
+        pol = 'stokes' if self.pol_type == 'stokes' else '_'.join(self.pols)
+        return wu.get_npz_name(self.files[0], pol, wu.get_span(self.freq_ranges), self.mode())[:-3] + 'profile.json'
+
+    def npz_names(self):
+        """
+        Returns the names of the npz files that logic() saves, if known ahead of time.
+        """
+        if self.args.delay_avg or self.args.stair:
+            return []
+        elif self.pol_type == 'stokes':
+            return [wu.get_npz_name(wu.stokes_file(self.files, pol), 'stokes' + pol, freq_range, self.mode()) for freq_range in self.freq_ranges for pol in wu.STOKES]
+        return [wu.get_npz_name(self.files[i], self.pols[i], freq_range, self.mode()) for freq_range in self.freq_ranges for i in range(len(self.pols))]
+
+    def memory(self):
+        """
+        Returns a rough estimate of the peak memory of logic() in bytes.
+        """
+        nbytes = 0
+        for pol_files in self.files:
+            for file in pol_files:
+                visdata = os.path.join(file, 'visdata')
+                if os.path.exists(visdata):
+                    nbytes += os.path.getsize(visdata)
+
+        if self.args.stream:
+            nbytes = nbytes * min(self.args.stream, len(self.files[0])) / len(self.files[0])
+
+        #only the channels spanning the bands are held
+        if os.path.exists(self.files[0][0]):
+            nchan = mu.get_nchan(self.files[0][0])
+            span = wu.get_span(self.freq_ranges)
+            nbytes = nbytes * min(span[1] - span[0], nchan) / nchan
+        return MEMORY_FACTOR * nbytes
+
+def available_memory():
+    """
+    Returns the available memory in bytes from /proc/meminfo, or None if it is unknown.
+    """
+    try:
+        with open('/proc/meminfo') as meminfo:
+            for line in meminfo:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except IOError:
+        pass
+    return None
+
+def read_manifest(path):
+    """
+    Returns the manifest at path, or an empty one if there is none or it cannot be read,
+    in which case every job runs again.
+    """
+    if path is None or not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as manifest:
+            manifest = json.load(manifest)
+    except ValueError:
+        manifest = None
+    if not isinstance(manifest, dict):
+        print 'Ignoring unreadable manifest {}.'.format(path)
+        return {}
+    return manifest
+
+def write_manifest(path, manifest):
+    if path is None:
+        return
+    with ch.atomic_open(path, 'w') as tmp:
+        json.dump(manifest, tmp, indent=1, sort_keys=True)
+
+def run_batches(batches, load, max_mem=None, manifest_path=None):
+    """
+    Runs the logic() of every Batch in at most load processes, within max_mem bytes of
+    memory estimates, skipping those the manifest records as done. Returns the failed ones.
+    """
+    manifest = read_manifest(manifest_path)
+    queue, running, failed = [], [], []
+    for zen in batches:
+        key = ','.join(zen.args.filenames)
+        outputs = zen.npz_names()
+        entry = manifest.get(key)
+        if isinstance(entry, dict) and entry.get('status') == 'done' and outputs and all(os.path.exists(npz) for npz in outputs):
+            print 'Skipping {}: already done.'.format(key)
+            continue
+        queue.append((key, zen, zen.memory()))
+
+    while queue or running:
+        # Admit queued jobs, in order, while there is a free slot and memory for them.
+        while queue and len(running) < load:
+            key, zen, memory = queue[0]
+            in_use = sum(job[2] for job in running)
+            if running and max_mem is not None and in_use + memory > max_mem:
+                break
+
+            queue.pop(0)
+            proc = multiprocessing.Process(target=zen.logic)
+            proc.start()
+            running.append((key, proc, memory, zen))
+            print 'Started {} (~{:.2f} GB).'.format(key, memory / 2.**30)
+
+        time.sleep(0.1)
+        for job in running[:]:
+            key, proc, memory, zen = job
+            if proc.is_alive():
+                continue
+
+            proc.join()
+            running.remove(job)
+            if proc.exitcode == 0:
+                manifest[key] = {'status': 'done', 'outputs': zen.npz_names()}
+            else:
+                manifest[key] = {'status': 'failed', 'exitcode': proc.exitcode}
+                failed.append(key)
+                print 'Failed {} (exit code {}).'.format(key, proc.exitcode)
+            write_manifest(manifest_path, manifest)
+
+    return failed
+
+if args.step is not None:
+    step, files = args.step, args.filenames
+    del args.step, args.filenames
+
+    files_xx = [file for file in files if 'xx' in file]
+    num_files_xx = len(files_xx)
+
+    batches = []
+    for index in range(0, num_files_xx, step):
+        args.filenames = files_xx[index : index + step]
+        batches.append(Batch(copy.copy(args)))
+
+    max_mem = args.max_mem * 2**30 if args.max_mem is not None else available_memory()
+    failed = run_batches(batches, args.load, max_mem, args.manifest)
+
+    if failed:
+        print 'Step program complete, with {} failed job(s):'.format(len(failed))
+        for key in failed:
+            print '    {}'.format(key)
+        raise SystemExit(1)
+    print 'Step program complete.'
+
+elif args.stair:
+    # The wedge modes add one file at a time and save an npz for every prefix of the files.
+    args.filenames = [file for file in args.filenames if 'xx' in file]
+    zen = Batch(args)
+    zen.logic()
+
+    print 'Stair program complete.'
+
+else:
+    zen = Batch(args)
     zen.logic()
\ No newline at end of file
@@ -1,22 +1,19 @@
-import imageio, glob, argparse, pprint
+import glob, argparse, pprint
+import anim_utils
 
 parser = argparse.ArgumentParser()
 parser.add_argument('-F', '--files', help='Files to be giffed. Must use "-F=" notation.', nargs='*', required=True)
 parser.add_argument('-s', '--save', help='Input path for save location.', default='./')
 parser.add_argument('-d', '--duration', help='Set duration of each from of gif in seconds.', default=2, type=float)
+parser.add_argument('-z', '--downsample', help='Keep every nth pixel of each frame along both axes.', default=1, type=int)
+parser.add_argument('-f', '--format', help='Animation format: "gif", or "mp4" (needs the ffmpeg plugin of imageio).', choices=['gif', 'mp4'], default='gif')
+parser.add_argument('-p', '--prefetch', help='How many frames to decode ahead of the writer.', default=4, type=int)
 args = parser.parse_args()
 
 
 images = sorted(glob.glob("{}".format(" ".join(args.files))))
 
-gif =[]
-for image in images:
-    gif.append(imageio.imread(image))
-
-day = images[0].split('/')[-1].split('.')[1]
-start = images[0].split('/')[-1].split('.')[2]
-end = images[-1].split('/')[-1].split('.')[2]
-length = len(images)
- 
-kargs = {'duration': args.duration} # in seconds
-imageio.mimsave("{}day{}__{}files__start{}__end{}.gif".format(args.save, day, length, start, end), gif,**kargs)
\ No newline at end of file
+# Frames are decoded in the background and appended to the animation one at a time,
+# so that only a few of them are ever held in memory.
+frames = anim_utils.prefetch(anim_utils.read_frames(images, args.downsample), args.prefetch)
+anim_utils.write_animation(anim_utils.anim_name(images, args.save, args.format), frames, args.duration, args.format)
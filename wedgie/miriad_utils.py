@@ -0,0 +1,141 @@
+"""
+Module for reading miriad files, keeping only the channels that are used
+"""
+import aipy
+import numpy as np
+import vis_utils as vu
+
+# Most antenna pairs to select in miriad itself. Each pair is a select clause that costs
+# a few ms to set up per file, so larger selections exclude every antenna outside the
+# pairs instead, which is cheap, and filter the pairs left record by record.
+MAX_SELECT = 32
+
+def pair_antstr(pairs):
+    return ','.join('{}_{}'.format(i, j) for i, j in pairs)
+
+def read_records(filenames, antstr='cross', polstr=-1, chans=None, pairs=None):
+    """
+    Yields the (time, lst, pair, pol, data, flags) of every record of the miriad files
+    filenames, cut down to the channels of the slice chans (all if None) and copied out,
+    so that the full record is not kept alive by a view of it. The flags are True where
+    the data are bad.
+
+    If pairs is given, only those antenna pairs are read: miriad skips the other records
+    itself, pair by pair for up to MAX_SELECT pairs and antenna by antenna for more, and
+    any others are dropped before they are copied.
+    """
+    if type(filenames) == str:
+        filenames = [filenames]
+    if chans is None:
+        chans = slice(None)
+    keep, ants = None, None
+    if pairs is not None:
+        keep = set(pairs)
+        if len(keep) <= MAX_SELECT:
+            antstr = pair_antstr(sorted(keep))
+        else:
+            ants = set(ant for pair in keep for ant in pair)
+
+    for filename in filenames:
+        uv = aipy.miriad.UV(filename)
+        aipy.scripting.uv_selector(uv, antstr, polstr)
+        if ants is not None:
+            for ant in range(uv['nants']):
+                if ant not in ants:
+                    uv.select('antennae', ant, -1, include=False)
+        nchan = uv['nchan']
+        while True:
+            (crd, t, (i, j)), d, f, nread = uv.raw_read(nchan)
+            if nread == 0:
+                break
+            if keep is not None and (i, j) not in keep:
+                continue
+            yield t, uv['lst'], (i, j), aipy.miriad.pol2str[uv['pol']], d[chans].copy(), np.logical_not(f[chans])
+        del(uv)
+
+def read_files(filenames, antstr='cross', polstr=-1, chans=None, pairs=None):
+    """
+    Reads the miriad files filenames as capo.miriad.read_files does, returning the info
+    dictionary of times, lsts and freqs and the data and flags dictionaries keyed on
+    antenna pair and pol. Only the channels of the slice chans (all if None) and the
+    antenna pairs of pairs (all of antstr if None) are kept, see read_records.
+    info['freqs'] keeps every channel.
+    """
+    if type(filenames) == str:
+        filenames = [filenames]
+
+    info = {'lsts': [], 'times': []}
+    times = set()
+    dat, flg = {}, {}
+    for t, lst, pair, pol, d, f in read_records(filenames, antstr, polstr, chans, pairs):
+        if t not in times:
+            times.add(t)
+            info['times'].append(t)
+            info['lsts'].append(lst)
+        dat.setdefault(pair, {}).setdefault(pol, []).append(d)
+        flg.setdefault(pair, {}).setdefault(pol, []).append(f)
+    info['freqs'] = get_freqs(filenames[-1])
+
+    for bl in dat:
+        for pol in dat[bl]:
+            dat[bl][pol] = np.array(dat[bl][pol])
+            flg[bl][pol] = np.array(flg[bl][pol])
+    info['lsts'] = np.array(info['lsts'])
+    info['times'] = np.array(info['times'])
+
+    return info, dat, flg
+
+def read_vis(files, pols, chans=None, pairs=None):
+    """
+    Reads the miriad files of every pol of pols (files holding a list of files for each)
+    straight into a vis_utils.Visibilities over the channels of the slice chans (all if
+    None). Its baselines are pairs, in order, or every cross-correlation read, sorted.
+    Each record is copied into place once, with no dictionaries of pairs and pols in
+    between, and dropped as soon as it is; samples missing from the files are flagged.
+    """
+    times, lsts, time_index = [], [], {}
+    records = []
+    for pol_index, (pol, pol_files) in enumerate(zip(pols, files)):
+        for t, lst, pair, record_pol, d, f in read_records(pol_files, 'cross', pol, chans, pairs):
+            if t not in time_index:
+                time_index[t] = len(times)
+                times.append(t)
+                lsts.append(lst)
+            records.append((pol_index, pair, time_index[t], d, f))
+
+    if not records:
+        raise ValueError("No cross-correlations of {} were read from the files.".format(', '.join(pols)))
+    if pairs is None:
+        pairs = sorted(set(record[1] for record in records))
+    missing = set(pairs) - set(record[1] for record in records)
+    if missing:
+        raise KeyError("Antenna pairs {} are not in the files.".format(sorted(missing)))
+    pair_index = dict((pair, index) for index, pair in enumerate(pairs))
+
+    shape = (len(pols), len(pairs), len(times), len(records[0][3]))
+    data = np.zeros(shape, dtype=records[0][3].dtype)
+    flags = np.ones(shape, dtype=bool)
+    records.reverse()
+    while records:
+        pol_index, pair, time, d, f = records.pop()
+        data[pol_index, pair_index[pair], time] = d
+        flags[pol_index, pair_index[pair], time] = f
+
+    freqs = get_freqs(files[0][0])
+    channels = np.arange(len(freqs))
+    if chans is not None:
+        freqs, channels = freqs[chans], channels[chans]
+
+    return vu.Visibilities(data, flags, pols, pairs, times, lsts, freqs, channels)
+
+def get_freqs(filename):
+    uv = aipy.miriad.UV(filename)
+    freqs = aipy.cal.get_freqs(uv['sdf'], uv['sfreq'], uv['nchan'])
+    del(uv)
+    return freqs
+
+def get_nchan(filename):
+    uv = aipy.miriad.UV(filename)
+    nchan = uv['nchan']
+    del(uv)
+    return nchan
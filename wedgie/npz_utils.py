@@ -0,0 +1,170 @@
+"""
+Module for reading and writing the npz files of getWedge
+
+Numeric arrays are stored uncompressed, one .npy member each, so that they can be memory
+mapped straight out of the zip; the metadata (pol, hist, lst, slpdct, prs) is stored as
+one JSON string in the 'meta' member rather than as pickled object arrays. np.load still
+reads the files, without allow_pickle.
+"""
+import json, multiprocessing, struct, zipfile
+import numpy as np
+import profile_utils as pu
+
+# Keys that are stored in the JSON metadata and returned as python objects.
+METADATA = ('pol', 'hist', 'lst', 'slpdct', 'prs')
+
+def json_default(obj):
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    return str(obj)
+
+def encode_meta(meta):
+    """
+    Returns meta as a JSON string. slpdct and prs have tuple and float keys, so they are
+    flattened into lists of [baseline, slope, pairs] and [ant1, ant2, baseline, slope].
+    """
+    meta = dict(meta)
+    if 'slpdct' in meta:
+        slopedict = meta['slpdct']
+        meta['slpdct'] = [[baseline, slope, slopedict[baseline][slope]] for baseline in sorted(slopedict.keys()) for slope in sorted(slopedict[baseline].keys())]
+    if 'prs' in meta:
+        meta['prs'] = [list(pair) + list(meta['prs'][pair]) for pair in sorted(meta['prs'].keys())]
+
+    return json.dumps(meta, default=json_default)
+
+def decode_meta(meta_json):
+    meta = dict((str(key), value) for key, value in json.loads(meta_json).items())
+    if 'slpdct' in meta:
+        slopedict = {}
+        for baseline, slope, pairs in meta['slpdct']:
+            slopedict.setdefault(baseline, {})[slope] = [tuple(pair) for pair in pairs]
+        meta['slpdct'] = slopedict
+    if 'prs' in meta:
+        meta['prs'] = dict(((ant1, ant2), (baseline, slope)) for ant1, ant2, baseline, slope in meta['prs'])
+    if 'pol' in meta:
+        meta['pol'] = str(meta['pol'])
+
+    return meta
+
+@pu.profiled('save')
+def save(npz_name, meta, **arrays):
+    """
+    Writes the numeric arrays and the metadata dictionary meta (see encode_meta) to the
+    npz file npz_name.
+    """
+    np.savez(npz_name, meta=np.array(encode_meta(meta)), **arrays)
+    return npz_name
+
+def member_array(npz_name, zf, name):
+    """
+    Returns the .npy member name of the open zip zf as a read-only memory map of npz_name,
+    or None if it cannot be mapped (compressed, object, empty or 0-d arrays).
+    """
+    info = zf.getinfo(name)
+    if info.compress_type != zipfile.ZIP_STORED:
+        return None
+
+    with open(npz_name, 'rb') as f:
+        # The member data follows its local header, whose extra field may differ from the
+        # one in the central directory.
+        f.seek(info.header_offset)
+        name_length, extra_length = struct.unpack('<HH', f.read(30)[26:30])
+        f.seek(info.header_offset + 30 + name_length + extra_length)
+
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+
+    if dtype.hasobject or not shape or 0 in shape:
+        return None
+    return np.memmap(npz_name, dtype=dtype, mode='r', shape=shape, order='F' if fortran_order else 'C', offset=offset)
+
+class WedgeFile:
+    """
+    Lazily loaded npz file of getWedge. Numeric arrays are memory mapped on first access,
+    so that only the slices that are used are read; metadata is returned as python
+    objects. Files written before the metadata moved to JSON are read through their
+    pickled object arrays.
+    """
+    def __init__(self, npz_name):
+        self.npz_name = npz_name
+        self.zf = zipfile.ZipFile(npz_name)
+        self.files = [name[:-4] for name in self.zf.namelist() if name.endswith('.npy')]
+        self.arrays = {}
+        self.npz = None
+        self.meta = None
+
+    def keys(self):
+        if 'meta' not in self.files:
+            return list(self.files)
+        return [key for key in self.files if key != 'meta'] + sorted(self.metadata().keys())
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def legacy(self, key):
+        if self.npz is None:
+            self.npz = np.load(self.npz_name, allow_pickle=True)
+        value = self.npz[key]
+        if key in METADATA:
+            return str(value) if key == 'pol' else value.tolist()
+        return value
+
+    def metadata(self):
+        if self.meta is None:
+            self.meta = decode_meta(str(self.legacy('meta')))
+        return self.meta
+
+    def __getitem__(self, key):
+        if key in METADATA and 'meta' in self.files:
+            return self.metadata()[key]
+        if key in METADATA and key in self.files:
+            return self.legacy(key)
+        if key not in self.files:
+            raise KeyError("{} is not a file in {}.".format(key, self.npz_name))
+
+        if key not in self.arrays:
+            array = member_array(self.npz_name, self.zf, key + '.npy')
+            self.arrays[key] = array if array is not None else self.legacy(key)
+        return self.arrays[key]
+
+    def close(self):
+        self.zf.close()
+        if self.npz is not None:
+            self.npz.close()
+        self.arrays = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def load(npz_name):
+    return WedgeFile(npz_name)
+
+def call_job(job):
+    return job[0](*job[1:])
+
+def map_npzs(func, npz_names, nproc=1, *args):
+    """
+    Returns func(npz_name, *args) of every npz file of npz_names, in order, computed by a
+    pool of nproc processes if nproc > 1. func must be a module-level function.
+    """
+    jobs = [(func, npz_name) + args for npz_name in npz_names]
+    if nproc > 1 and len(jobs) > 1:
+        pool = multiprocessing.Pool(nproc)
+        try:
+            return pool.map(call_job, jobs, chunksize=max(1, len(jobs) // (4 * nproc)))
+        finally:
+            pool.close()
+            pool.join()
+    return map(call_job, jobs)
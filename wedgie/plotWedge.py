@@ -3,7 +3,7 @@ This program compliments getWedge.py by being able to plot the npz files generat
 
 Author: Austin Fox Fortino ,fortino@sas.upenn.edu
 """
-import argparse, wedge_utils
+import argparse, wedge_utils, stats_utils, pspec_utils, render_utils, anim_utils
 
 parser = argparse.ArgumentParser()
 parser.add_argument('-F', '--filenames', help='Input a list of filenames to be analyzed.', nargs='*', required=True)
@@ -12,12 +12,43 @@ parser.add_argument('-m', '--multi_plot', help='Plot 4 plots at once from suppli
 parser.add_argument('-f', '--flavors_plot', action='store_true')
 parser.add_argument('-b', '--multi_bl_plot', help='Plot 4 plots for blavg.', action='store_true')
 parser.add_argument('-a', '--avg_plot', help='Plots average value inside and outside wedge per files analyzed.',action='store_true')
+parser.add_argument('-w', '--buffer', help='Delay buffer (ns) added to the horizon for --avg_plot.', type=float, default=0.)
+parser.add_argument('-n', '--nproc', help='How many processes to read npz files with for --avg_plot and --batch.', type=int, default=1)
+parser.add_argument('-c', '--csv', help='Write the --avg_plot statistics table to this file.', default=None)
+parser.add_argument('-k', '--kbin', help='Bin the supplied npz files onto one (k_perpendicular, k_parallel) grid, save it to this npz file and plot it.', default=None)
+parser.add_argument('-K', '--kbins', help='Number of k_perpendicular and k_parallel bins for --kbin, separated by an underscore: "20_40"', default='20_40')
 parser.add_argument('-d', '--delay_plot', help='Plot a single plot from supplied delayavg npz file', action='store_true')
 parser.add_argument('-l', '--plot_bltype', help='Plot non-averaged plots for given bltype file.', action='store_true')
 parser.add_argument('-o', '--plot_1D', help="Plot (optional: specified as comma delimited list) baselines' wedges on a 1D plot from supplied npz file", default=None, const='all', nargs='?', action='store')
+parser.add_argument('-B', '--batch', help='Render every supplied npz file to png (by its mode) in a pool of --nproc processes, skipping pngs newer than their npz.', action='store_true')
+parser.add_argument('-R', '--rerender', help='Render every file for --batch, even if its png is up to date.', action='store_true')
+parser.add_argument('-O', '--out_dir', help='Directory to write the --batch pngs or the --animate animation to.', default='.')
+parser.add_argument('-G', '--animate', help='Render the supplied npz files, in the order given, straight into one animation.', action='store_true')
+parser.add_argument('-D', '--duration', help='Duration of each frame of --animate in seconds.', type=float, default=2.)
+parser.add_argument('-e', '--anim_format', help='Format of --animate: "gif", or "mp4" (needs the ffmpeg plugin of imageio).', choices=['gif', 'mp4'], default='gif')
+parser.add_argument('-v', '--vlim', help='Fixed colour scale of --animate and --batch, separated by an underscore. Must use "-v=" notation: -v=-3_1', default=None)
 args = parser.parse_args()
 
-if (args.plot_1D is not None) and not args.multi_plot:
+vlim = None
+if args.vlim is not None:
+    vlim = tuple(float(v) for v in args.vlim.split('_'))
+
+if args.animate:
+    # Frames are drawn in memory on one reused figure, a few ahead of the writer.
+    anim_name = anim_utils.anim_name(args.filenames, args.out_dir.rstrip('/') + '/', args.anim_format)
+    frames = anim_utils.prefetch(render_utils.render_frames(args.filenames, vlim))
+    nframes = anim_utils.write_animation(anim_name, frames, args.duration, args.anim_format)
+    print 'Wrote {} frames to {}.'.format(nframes, anim_name)
+
+elif args.batch:
+    results = render_utils.render_batch(args.filenames, args.nproc, args.out_dir, args.rerender, vlim)
+    for npz_name, png, status in results:
+        if status not in ('rendered', 'skipped'):
+            print '{}: {}'.format(npz_name, status)
+    statuses = [status for npz_name, png, status in results]
+    print 'Rendered {}, skipped {}, failed {}.'.format(statuses.count('rendered'), statuses.count('skipped'), len(statuses) - statuses.count('rendered') - statuses.count('skipped'))
+
+elif (args.plot_1D is not None) and not args.multi_plot:
     if args.plot_1D == 'all':
         baselines = []
     else:
@@ -53,8 +84,17 @@ elif args.multi_plot:
 elif args.multi_bl_plot:
     wedge_utils.plot_multi_blavg(args.filenames)
 
+elif args.kbin is not None:
+    nkpr, nkpl = [int(nbins) for nbins in args.kbins.split('_')]
+    kpr_edges, kpl_edges = pspec_utils.get_edges(args.filenames[0], nkpr, nkpl)
+    pspec, counts = pspec_utils.bin_npzs(args.filenames, kpr_edges, kpl_edges)
+    pspec_utils.save_kbin(args.kbin, pspec, counts, kpr_edges, kpl_edges, args.filenames)
+    wedge_utils.plot_kbin(args.kbin)
+
 elif args.avg_plot:
-    wedge_utils.plot_avgs(args.filenames)
+    table = wedge_utils.plot_avgs(args.filenames, args.buffer, args.nproc)
+    if args.csv is not None:
+        stats_utils.save_table(table, args.csv)
 
 elif args.flavors_plot:
     if len(args.filenames) > 1:
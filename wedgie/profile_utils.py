@@ -0,0 +1,185 @@
+"""
+Module for timing the stages of a getWedge run (see getWedge.py --profile)
+"""
+import os, time, json, shutil, resource, tempfile, contextlib, functools
+
+# Whether stages are timed; off unless enable() is called.
+ENABLED = False
+
+# Totals of every stage so far in this process, keyed on (stage, pol, mode, group), as
+# [calls, wall seconds, peak RSS (MB) at the end of a call, rise of the peak RSS (MB)].
+STATS = {}
+
+# Tags of the stages being run, set by context().
+CONTEXT = {'pol': None, 'mode': None, 'group': None}
+
+# Label of the redundant group of every antenna pair of the wedge mode being run, set by
+# set_groups; the per-baseline stages are timed group by group (see group_rows).
+GROUPS = {}
+
+# Directory that child processes hand their stats back through, one subdirectory per parent.
+SPOOL = None
+
+def enable():
+    global ENABLED, SPOOL
+    ENABLED = True
+    if SPOOL is None:
+        SPOOL = tempfile.mkdtemp(prefix='wedgie_profile_')
+
+def peak_rss():
+    """
+    Returns the peak resident memory of this process so far in MB.
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+
+@contextlib.contextmanager
+def context(**tags):
+    """
+    Tags every stage run within it with tags, e.g. context(pol='xx', mode='timeavg').
+    """
+    old = dict(CONTEXT)
+    CONTEXT.update(tags)
+    try:
+        yield
+    finally:
+        CONTEXT.clear()
+        CONTEXT.update(old)
+
+@contextlib.contextmanager
+def stage(name):
+    """
+    Adds the wall time, a call and the memory of the code run within it to the totals of
+    stage name under the current tags. Stages may nest; each counts its own wall time.
+    """
+    if not ENABLED:
+        yield
+        return
+
+    start_peak, start = peak_rss(), time.time()
+    try:
+        yield
+    finally:
+        wall, end_peak = time.time() - start, peak_rss()
+        entry = STATS.setdefault((name, CONTEXT['pol'], CONTEXT['mode'], CONTEXT['group']), [0, 0., 0., 0.])
+        entry[0] += 1
+        entry[1] += wall
+        entry[2] = max(entry[2], end_peak)
+        entry[3] += end_peak - start_peak
+
+def profiled(name):
+    """
+    Decorates a function so that every call of it is timed as stage name.
+    """
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def group_label(key):
+    """
+    Returns the label of a redundant group key: a baseline length, a (baseline, slope)
+    flavor or an antenna pair, e.g. '14.6' or '3_15'.
+    """
+    if isinstance(key, tuple):
+        return '_'.join(str(part) for part in key)
+    return str(key)
+
+def set_groups(groups):
+    """
+    Labels every antenna pair of groups, a dictionary of pair lists keyed on their group
+    (as for order_pairs), with the group_label of its key.
+    """
+    GROUPS.clear()
+    for key, pairs in groups.items():
+        for pair in pairs:
+            GROUPS[tuple(pair)] = group_label(key)
+
+def group_rows(pairs):
+    """
+    Returns the (label, rows) of every group of the rows of pairs, in order of their first
+    row, or None if stages are not timed group by group: profiling is off, no groups are
+    set or a group is being run already. Pairs outside the groups are labelled None.
+    """
+    if not ENABLED or not GROUPS or pairs is None or CONTEXT['group'] is not None:
+        return None
+
+    labels, rows = [], {}
+    for row, pair in enumerate(pairs):
+        label = GROUPS.get(tuple(pair))
+        if label not in rows:
+            labels.append(label)
+            rows[label] = []
+        rows[label].append(row)
+    return [(label, rows[label]) for label in labels]
+
+def merge(stats):
+    for key, (calls, wall, peak, rise) in stats:
+        entry = STATS.setdefault(tuple(key), [0, 0., 0., 0.])
+        entry[0] += calls
+        entry[1] += wall
+        entry[2] = max(entry[2], peak)
+        entry[3] += rise
+
+def spool_dir(pid=None):
+    path = os.path.join(SPOOL, str(pid or os.getpid()))
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    return path
+
+def child(target):
+    """
+    Returns target wrapped to run in a child process of this one and hand its stats back
+    to it when done (see collect), or target itself if profiling is off.
+    """
+    if not ENABLED:
+        return target
+    spool = spool_dir()
+
+    def run(*args):
+        STATS.clear()
+        try:
+            target(*args)
+        finally:
+            with open(os.path.join(spool, '{}.json'.format(os.getpid())), 'w') as f:
+                json.dump(STATS.items(), f)
+    return run
+
+def collect():
+    """
+    Merges the stats handed back by the finished child processes of this one.
+    """
+    if not ENABLED:
+        return
+    spool = spool_dir()
+    for name in sorted(os.listdir(spool)):
+        with open(os.path.join(spool, name)) as f:
+            merge(json.load(f))
+        os.remove(os.path.join(spool, name))
+
+def report(json_name, total, history=None):
+    """
+    Writes the stats of the run to json_name, along with its total wall time and args
+    history, and prints them as a table of stages by wall time. Returns the report.
+    """
+    global SPOOL
+    collect()
+    shutil.rmtree(SPOOL, ignore_errors=True)
+    SPOOL = None
+    stages = []
+    for (name, pol, mode, group), (calls, wall, peak, rise) in sorted(STATS.items(), key=lambda item: -item[1][1]):
+        stages.append({'stage': name, 'pol': pol, 'mode': mode, 'group': group, 'calls': calls, 'wall': wall, 'peak_mb': peak, 'peak_rise_mb': rise})
+    profile = {'total_wall': total, 'peak_mb': peak_rss(), 'stages': stages, 'history': history}
+
+    with open(json_name, 'w') as f:
+        json.dump(profile, f, indent=1, sort_keys=True)
+
+    print '{:<10} {:<8} {:<10} {:<16} {:>7} {:>10} {:>7} {:>10}'.format('stage', 'pol', 'mode', 'group', 'calls', 'wall (s)', '% wall', 'peak (MB)')
+    for entry in stages:
+        print '{stage:<10} {pol!s:<8} {mode!s:<10} {group:<16} {calls:>7} {wall:>10.3f} {share:>7.1f} {peak_mb:>10.1f}'.format(share=100. * entry['wall'] / total if total else 0., **dict(entry, group=entry['group'] or '-'))
+    print 'Total wall time {:.3f} s, peak memory {:.1f} MB.'.format(total, profile['peak_mb'])
+    print json_name
+
+    return profile
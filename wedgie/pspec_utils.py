@@ -0,0 +1,109 @@
+"""
+Module for binning wedges onto a cylindrical (k_perpendicular, k_parallel) grid
+"""
+import numpy as np
+import cosmo_utils as cu
+import stats_utils as su
+import npz_utils as nu
+
+# Conversion factors computed so far in this process, keyed on the band (see k_factors).
+K_FACTORS = {}
+
+def k_factors(freqs):
+    """
+    Returns the factors converting a baseline length (m) to k_perpendicular (h/Mpc) and a
+    delay (ns) to k_parallel (h/Mpc) for the band freqs (GHz, equally spaced), evaluated
+    at its central frequency. They are computed once per band and shared by every wedge.
+    """
+    key = (float(freqs[0]), float(freqs[-1]), len(freqs))
+    if key not in K_FACTORS:
+        cen_fq = (freqs[0] + freqs[-1]) / 2.
+        kpr_per_m = float(cu.uv2kpr_fast(1., cen_fq))
+        kpl_per_ns = float(cu.dk_deta_fast(cu.f2z_fast(cen_fq)))
+        K_FACTORS[key] = (kpr_per_m, kpl_per_ns)
+
+    return K_FACTORS[key]
+
+def wedge_k(bls, freqs):
+    """
+    Returns the k_perpendicular of every baseline length in bls (m) and the k_parallel of
+    every delay bin of a wedge over freqs (GHz), in the fftshifted order of wdgslc.
+    """
+    kpr_per_m, kpl_per_ns = k_factors(freqs)
+    etas = np.fft.fftshift(np.fft.fftfreq(len(freqs), freqs[1] - freqs[0]))
+
+    return np.asarray(bls, dtype=float) * kpr_per_m, etas * kpl_per_ns
+
+def bin_wedge(wdgslc, bls, freqs, kpr_edges, kpl_edges, fold=True):
+    """
+    Accumulates the (linear) power of a wedge onto the grid of kpr_edges and kpl_edges
+    with one weighted 2D histogram. wdgslc holds log10 power, as saved by getWedge,
+    either (nbls, ndlys) or (nbls, ntimes, ndlys). With fold, k_parallel is folded onto
+    |k_parallel|. Returns the (nkpr, nkpl) grids of summed power and sample counts, so
+    that wedges of many files or nights can be added together before averaging.
+    """
+    wdgslc = np.asarray(wdgslc)
+    kpr, kpl = wedge_k(bls, freqs)
+    if fold:
+        kpl = np.abs(kpl)
+
+    kpr = np.broadcast_to(kpr.reshape((-1,) + (1,) * (wdgslc.ndim - 1)), wdgslc.shape)
+    kpl = np.broadcast_to(kpl, wdgslc.shape)
+
+    power = 10**wdgslc
+    good = np.isfinite(power)
+    sums = np.histogram2d(kpr[good], kpl[good], bins=(kpr_edges, kpl_edges), weights=power[good])[0]
+    counts = np.histogram2d(kpr[good], kpl[good], bins=(kpr_edges, kpl_edges))[0]
+
+    return sums, counts
+
+def npz_freqs(data):
+    """
+    Returns the frequencies (GHz) of an npz file saved by getWedge, or None for npz files
+    saved before the frequencies were.
+    """
+    if 'frqs' in data.keys():
+        return data['frqs']
+    return None
+
+def bin_npzs(npz_names, kpr_edges, kpl_edges, fold=True, freqs=None):
+    """
+    Bins the wedges of every npz file of npz_names onto a common (kpr_edges, kpl_edges)
+    grid (see bin_wedge) and returns the average power and the sample count of every
+    cell; empty cells are NaN. freqs (GHz) is only needed for npz files that do not
+    hold their own.
+    """
+    sums = np.zeros((len(kpr_edges) - 1, len(kpl_edges) - 1))
+    counts = np.zeros_like(sums)
+    for npz_name in npz_names:
+        data = nu.load(npz_name)
+        npz_fqs = npz_freqs(data)
+        if npz_fqs is None:
+            if freqs is None:
+                raise ValueError("{} does not hold its frequencies; pass freqs.".format(npz_name))
+            npz_fqs = freqs
+
+        _sums, _counts = bin_wedge(su.wedge_rows(data), su.row_lengths(data), npz_fqs, kpr_edges, kpl_edges, fold)
+        sums += _sums
+        counts += _counts
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pspec = sums / counts
+
+    return pspec, counts
+
+def get_edges(npz_name, nkpr=20, nkpl=40, fold=True, freqs=None):
+    """
+    Returns linear k_perpendicular and k_parallel bin edges spanning the wedge of
+    npz_name, for use as a common grid for many files.
+    """
+    data = nu.load(npz_name)
+    npz_fqs = npz_freqs(data)
+    kpr, kpl = wedge_k(su.row_lengths(data), npz_fqs if npz_fqs is not None else freqs)
+    kpl_lo = 0. if fold else kpl.min()
+
+    return np.linspace(0., kpr.max() * 1.05, nkpr + 1), np.linspace(kpl_lo, np.abs(kpl).max() * 1.0001, nkpl + 1)
+
+def save_kbin(npz_name, pspec, counts, kpr_edges, kpl_edges, npz_names):
+    np.savez(npz_name, pspec=pspec, counts=counts, kpr=kpr_edges, kpl=kpl_edges, npzs=npz_names)
+    return npz_name
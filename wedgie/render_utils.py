@@ -0,0 +1,197 @@
+"""
+Module for rendering many npz files of getWedge to png at once
+"""
+import os
+import numpy as np
+import scipy.constants as sc
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import npz_utils as nu
+
+# Figures built so far in this process, keyed on their layout (see get_figure); each is
+# reused for every npz file of that layout by updating its artists in place.
+FIGURE_CACHE = {}
+
+# Default colour scale (vmin, vmax) of every kind of plot, as in the plot_* functions.
+VLIMS = {'timeavg': (-3.0, 1.0), 'flavors': (-3.0, 1.0), 'blavg': (-9, 1), 'bltype': (-9, 1)}
+
+def npz_kind(npz_name):
+    """
+    Returns the kind of plot of npz_name from its mode, as named by getWedge: 'timeavg',
+    'flavors', 'blavg' or 'bltype', or None if it has none.
+    """
+    mode = npz_name.split('.')[-2]
+    if mode in ('timeavg', 'timavg'):
+        return 'timeavg'
+    elif mode in ('flavors', 'blavg'):
+        return mode
+    elif mode.startswith('bl_'):
+        return 'bltype'
+    return None
+
+def png_name(npz_name, out_dir='.'):
+    return os.path.join(out_dir, os.path.basename(npz_name)[:-3] + 'png')
+
+def up_to_date(npz_name, png):
+    return os.path.exists(png) and os.path.getmtime(png) >= os.path.getmtime(npz_name)
+
+def horizon_lines(light_times, rows):
+    """
+    Returns the x and y data of one line that draws the +/- horizon of every row, row i
+    spanning [rows[i], rows[i+1]], with NaNs between the segments.
+    """
+    x, y = [], []
+    for light_time, start, stop in zip(light_times, rows[:-1], rows[1:]):
+        x.extend([light_time, light_time, np.nan, -light_time, -light_time, np.nan])
+        y.extend([start, stop, np.nan, start, stop, np.nan])
+    return x, y
+
+def get_figure(kind, naxes):
+    """
+    Returns the cached figure of kind with naxes stacked axes, each with an image and a
+    horizon line, creating it on first use.
+    """
+    key = (kind, naxes)
+    if key in FIGURE_CACHE:
+        return FIGURE_CACHE[key]
+
+    if kind in ('timeavg', 'flavors'):
+        fig = Figure(figsize=(6.4, 4.8))
+        axes = [fig.add_subplot(111)]
+    else:
+        fig = Figure(figsize=(5, 11) if kind == 'blavg' else (6, 9))
+        axes = [fig.add_subplot(naxes, 1, i + 1) for i in range(naxes)]
+    FigureCanvasAgg(fig)
+    vmin, vmax = VLIMS[kind]
+
+    images, lines = [], []
+    for ax in axes:
+        images.append(ax.imshow(np.zeros((1, 2)), aspect='auto', interpolation='nearest', vmin=vmin, vmax=vmax))
+        lines.append(ax.plot([], [], color='white')[0])
+        ax.set_xlim((-450, 450))
+    for ax in axes[:-1]:
+        ax.tick_params(labelbottom=False)
+    axes[-1].set_xlabel("Delay (ns)")
+
+    if kind in ('timeavg', 'flavors'):
+        axes[0].set_ylabel("Baseline length (m)" if kind == 'timeavg' else "Baseline length (short to long)")
+        fig.colorbar(images[0], ax=axes[0]).set_label("log10((mK)^2)")
+    else:
+        fig.colorbar(images[-1], ax=axes).set_label("log10((mK)^2)")
+
+    FIGURE_CACHE[key] = (fig, axes, images, lines)
+    return FIGURE_CACHE[key]
+
+def render(npz_name, out_dir='.', force=False, vlim=None):
+    """
+    Renders npz_name to its png in out_dir, unless the png is newer than the npz (or
+    force). Returns (npz_name, png, status), status being 'rendered', 'skipped' or the
+    error raised.
+    """
+    png = png_name(npz_name, out_dir)
+    kind = npz_kind(npz_name)
+    if kind is None:
+        return npz_name, png, 'unknown mode'
+    if not force and up_to_date(npz_name, png):
+        return npz_name, png, 'skipped'
+
+    try:
+        with nu.load(npz_name) as data:
+            fig = draw(kind, data, os.path.basename(npz_name), vlim)
+            fig.savefig(png)
+    except Exception as error:
+        return npz_name, png, repr(error)
+    return npz_name, png, 'rendered'
+
+def draw(kind, data, name, vlim=None):
+    """
+    Updates the cached figure of kind with the wedge of the loaded npz data, named name,
+    on the colour scale vlim (defaults to VLIMS), and returns the figure.
+    """
+    dlys = data['dlys']
+    d_start, d_end = dlys[0], dlys[-1]
+    slices = data['antpairslc'] if kind == 'bltype' else data['wdgslc']
+
+    fig, axes, images, lines = get_figure(kind, 1 if kind in ('timeavg', 'flavors') else len(slices))
+    for image in images:
+        image.set_clim(*(vlim or VLIMS[kind]))
+
+    if kind in ('timeavg', 'flavors'):
+        wdgslc = slices
+        nrows = len(wdgslc)
+        images[0].set_data(wdgslc)
+        images[0].set_extent([d_start, d_end, nrows, 0])
+        axes[0].set_xlim((-450, 450))
+        axes[0].set_ylim((nrows, 0))
+
+        if kind == 'timeavg':
+            bls = data['bls']
+            ticks = [round(n, 1) for n in bls]
+            light_times = np.asarray(bls) / sc.c * 10**9
+            lst = data['lst']
+            fig.suptitle('JD ' + name.split('.')[1] + ' LST ' + str(lst[0]) + ' to ' + str(lst[-1]), size='large')
+        else:
+            slopedict = data['slpdct']
+            ticks, light_times = [], []
+            for baseline in sorted(slopedict.keys()):
+                for slope in sorted(slopedict[baseline].keys()):
+                    ticks.append("{:.3}: {:8.3}".format(baseline, slope))
+                    light_times.append(baseline / sc.c * 10**9)
+
+        axes[0].set_yticks(np.arange(len(ticks)))
+        axes[0].set_yticklabels(ticks)
+        axes[0].set_title(name.split('.')[3], size='medium')
+        lines[0].set_data(*horizon_lines(light_times, range(nrows + 1)))
+        return fig
+
+    if kind == 'bltype':
+        light_times = [float(data['length']) / sc.c * 10**9] * len(slices)
+        fig.suptitle(".".join(name.split('.')[1:4]) + '.baseline' + name.split('.')[7] + '\nbaseline length:' + str(data['length']))
+        for ax, antpair in zip(axes, data['antprs']):
+            ax.set_ylabel(str(tuple(antpair)), fontsize=6)
+    else:
+        light_times = np.asarray(data['bls']) / sc.c * 10**9
+        fig.suptitle(".".join(name.split('.')[1:4]))
+
+    for i in range(len(slices)):
+        # Read one baseline (or antenna pair) at a time from the memory map.
+        wedgeslice = slices[i]
+        ntimes = wedgeslice.shape[0]
+        images[i].set_data(wedgeslice)
+        images[i].set_extent([d_start, d_end, ntimes, 0])
+        axes[i].set_xlim((-450, 450))
+        axes[i].set_ylim((ntimes, 0))
+        lines[i].set_data(*horizon_lines([light_times[i]], [0, ntimes]))
+    return fig
+
+def frame(fig):
+    """
+    Returns the pixels of fig, drawn by Agg, as a (height, width, 4) RGBA array.
+    """
+    fig.canvas.draw()
+    width, height = fig.canvas.get_width_height()
+    return np.frombuffer(fig.canvas.buffer_rgba(), np.uint8).reshape((height, width, 4)).copy()
+
+def render_frames(npz_names, vlim=None):
+    """
+    Yields the frame of every npz file of npz_names, in order, drawn in memory on the
+    cached figures (see draw) on one colour scale, vlim, for all of them.
+    """
+    for npz_name in npz_names:
+        kind = npz_kind(npz_name)
+        if kind is None:
+            raise ValueError("{} has no mode to plot.".format(npz_name))
+
+        with nu.load(npz_name) as data:
+            yield frame(draw(kind, data, os.path.basename(npz_name), vlim))
+
+def render_batch(npz_names, nproc=1, out_dir='.', force=False, vlim=None):
+    """
+    Renders every npz file of npz_names (see render) to out_dir, creating it if need be,
+    across a pool of nproc processes, each reusing its figures from one file to the next.
+    Returns the list of (npz_name, png, status) of every file, in order.
+    """
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+
+    return nu.map_npzs(render, npz_names, nproc, out_dir, force, vlim)
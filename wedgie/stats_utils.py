@@ -0,0 +1,95 @@
+"""
+Module for statistics inside and outside the wedge of saved npz files
+"""
+import numpy as np
+import scipy.constants as sc
+import npz_utils as nu
+
+# Columns of the table returned by stats_table.
+STATS_DTYPE = [('npz', 'S256'), ('pol', 'S16'), ('num_files', int),
+               ('mean_in', float), ('mean_out', float),
+               ('median_in', float), ('median_out', float),
+               ('count_in', int), ('count_out', int)]
+
+def wedge_rows(data):
+    """
+    Returns the wedge of npz data: its antpairslc for bltype npz files, otherwise its wdgslc.
+    """
+    if 'antpairslc' in data.keys():
+        return data['antpairslc']
+    return data['wdgslc']
+
+def row_lengths(data):
+    """
+    Returns the baseline length (m) of every row of wedge_rows(data). Flavors npz files have
+    one row per (baseline, slope), in sorted order of both, bltype files one per antenna
+    pair of a single length; the others one per baseline.
+    """
+    if 'antpairslc' in data.keys():
+        return np.repeat(float(data['length']), len(data['antprs']))
+    if 'slpdct' in data.keys():
+        slopedict = data['slpdct']
+        return np.array([baseline for baseline in sorted(slopedict.keys()) for slope in sorted(slopedict[baseline].keys())])
+    return np.asarray(data['bls'], dtype=float)
+
+def horizon_mask(bls, dlys, buffer=0.):
+    """
+    Returns the (nbls, ndlys) boolean array that is True inside the wedge: at delays (ns)
+    within the light travel time of each baseline length (m), plus buffer (ns).
+    """
+    horizons = np.asarray(bls, dtype=float) / sc.c * 10**9
+    return np.abs(np.asarray(dlys))[np.newaxis, :] < (horizons + buffer)[:, np.newaxis]
+
+def wedge_stats(wdgslc, bls, dlys, buffer=0.):
+    """
+    Returns the means, medians and counts of the values of wdgslc inside and outside the
+    wedge, as a dictionary. wdgslc is (nbls, ndlys), or (nbls, ntimes, ndlys) for wedges
+    that are not averaged over time, with the mask broadcast over the times.
+    """
+    wdgslc = np.asarray(wdgslc)
+    mask = horizon_mask(bls, dlys, buffer)
+    if wdgslc.ndim == 3:
+        mask = mask[:, np.newaxis, :]
+    mask = np.broadcast_to(mask, wdgslc.shape)
+
+    inside, outside = wdgslc[mask], wdgslc[~mask]
+    stats = {'count_in': inside.size, 'count_out': outside.size}
+    for name, values in (('in', inside), ('out', outside)):
+        stats['mean_' + name] = values.mean() if values.size else np.nan
+        stats['median_' + name] = np.median(values) if values.size else np.nan
+
+    return stats
+
+def npz_stats(npz_name, buffer=0.):
+    """
+    Returns the wedge_stats of the npz file npz_name, along with its name, polarization
+    and number of files, as one row of the stats_table.
+    """
+    data = nu.load(npz_name)
+    history = data['hist']
+
+    stats = wedge_stats(wedge_rows(data), row_lengths(data), data['dlys'], buffer)
+    stats['npz'] = npz_name
+    stats['pol'] = str(data['pol'])
+    stats['num_files'] = len(history['filenames'])
+
+    return tuple(stats[name] for name, dtype in STATS_DTYPE)
+
+def stats_table(npz_names, buffer=0., nproc=1):
+    """
+    Returns the inside/outside wedge statistics of every npz file of npz_names as a single
+    record array, one row per file and one column per field of STATS_DTYPE. With
+    nproc > 1 the files are read by a pool of nproc processes.
+    """
+    rows = nu.map_npzs(npz_stats, npz_names, nproc, buffer)
+    return np.rec.array(np.array(rows, dtype=STATS_DTYPE))
+
+def save_table(table, filename):
+    """
+    Writes a stats_table to filename as comma-separated values, with a header row.
+    """
+    names = table.dtype.names
+    with open(filename, 'w') as f:
+        f.write(','.join(names) + '\n')
+        for row in table:
+            f.write(','.join(str(row[name]) for name in names) + '\n')
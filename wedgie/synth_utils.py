@@ -0,0 +1,129 @@
+"""
+Module for writing synthetic miriad files and calfiles, e.g. for benchWedge.py
+"""
+import os, shutil
+import aipy
+import numpy as np
+import scipy.constants as sc
+import hsa7458_v001
+
+# Start of the synthetic observations, and the length of an integration in days.
+JD_START = 2457746.16693
+INT_TIME = 10.7 / 86400.
+
+# Calfile of a hexagonal layout, written by write_calfile: the array model and location
+# of hsa7458_v001, with the antennae moved.
+CALFILE_TEMPLATE = '''"""
+Synthetic calfile of {nants} antennae on a hexagonal grid {sep} m apart, written by
+synth_utils.write_calfile.
+"""
+import aipy as a
+import numpy as n
+import hsa7458_v001 as base
+
+prms = {{
+    'loc': base.prms['loc'],
+    'antpos_ideal': {positions!r},
+}}
+
+def get_aa(freqs):
+    nants = len(prms['antpos_ideal'])
+    antpos_ideal = n.array([[prms['antpos_ideal'][i][top] for top in ('top_x', 'top_y', 'top_z')] for i in range(nants)])
+    pols = ('x', 'y')
+    antennas = [a.pol.Antenna(0., 0., 0., a.fit.Beam(freqs), phsoff=dict.fromkeys(pols, [0., 0.]), amp=dict.fromkeys(pols, 1.), bp_r=dict.fromkeys(pols, [1.]), bp_i=dict.fromkeys(pols, [0.])) for i in range(nants)]
+    aa = base.AntennaArray(prms['loc'], antennas, antpos_ideal=antpos_ideal)
+    aa.set_params(dict((str(i), prms['antpos_ideal'][i]) for i in range(nants)))
+    return aa
+'''
+
+def hsa_positions(nants=None):
+    """
+    Returns the positions of the first nants antennae of hsa7458_v001 (all if None),
+    keyed on antenna number, leaving out its placeholders.
+    """
+    antpos = hsa7458_v001.prms['antpos_ideal']
+    ants = sorted(ant for ant in antpos if antpos[ant]['top_z'] >= 0)
+
+    return dict((ant, dict(antpos[ant])) for ant in ants[:nants])
+
+def hex_positions(nants, sep=14.6):
+    """
+    Returns the positions of nants antennae on a hexagonal grid sep m apart, numbered
+    from 0 at the centre outwards ring by ring, as the antpos_ideal of a calfile.
+    """
+    directions = [(np.cos(np.pi / 3 * k), np.sin(np.pi / 3 * k)) for k in range(6)]
+    xy, ring = [(0., 0.)], 1
+    while len(xy) < nants:
+        # Walk the six sides of the ring, starting from its corner along the last direction.
+        x, y = ring * sep * directions[4][0], ring * sep * directions[4][1]
+        for side in range(6):
+            for step in range(ring):
+                xy.append((x, y))
+                x, y = x + sep * directions[side][0], y + sep * directions[side][1]
+        ring += 1
+
+    return dict((ant, {'top_x': round(x, 6), 'top_y': round(y, 6), 'top_z': 0.0}) for ant, (x, y) in enumerate(xy[:nants]))
+
+def write_calfile(path, name, positions, sep=14.6):
+    """
+    Writes the calfile module name to the directory path with the antenna positions
+    (see hex_positions) and returns its name.
+    """
+    with open(os.path.join(path, name + '.py'), 'w') as f:
+        f.write(CALFILE_TEMPLATE.format(nants=len(positions), sep=sep, positions=positions))
+    return name
+
+def file_name(path, jd, pol):
+    day, frac = int(jd), int(round((jd % 1) * 1e5))
+    return os.path.join(path, "zen.{}.{:05d}.{}.HH.uvcOR".format(day, frac, pol))
+
+def write_files(path, positions, nfiles=2, ntimes=10, nchan=64, flag_frac=0.1, pols=('xx',), seed=0, flag_first=False):
+    """
+    Writes nfiles miriad files of ntimes integrations each for every pol of pols to path,
+    holding every cross-correlation of the antennae of positions over nchan channels of
+    100-200 MHz. Each baseline sees a point source at a random delay within its horizon,
+    plus noise, and flag_frac of its samples are flagged at random. With flag_first the
+    first integration of every file is flagged throughout, which gives every baseline the
+    same CLEAN gain in every file. Returns the file names of every pol, in order.
+    """
+    rng = np.random.RandomState(seed)
+    ants = sorted(positions)
+    pairs = [(i, j) for index, i in enumerate(ants) for j in ants[index + 1:]]
+    sfreq, sdf = 0.1, 0.1 / nchan
+    freqs = sfreq + sdf * np.arange(nchan)
+
+    # Delay (ns) of the source on every baseline, within its horizon.
+    lengths = np.array([np.hypot(positions[j]['top_x'] - positions[i]['top_x'], positions[j]['top_y'] - positions[i]['top_y']) for i, j in pairs])
+    delays = lengths / sc.c * 1e9 * rng.uniform(-1, 1, len(pairs))
+    source = np.exp(-2j * np.pi * delays[:, np.newaxis] * freqs)
+
+    files = {}
+    for pol in pols:
+        files[pol] = []
+        for index in range(nfiles):
+            jd = JD_START + index * ntimes * INT_TIME
+            name = file_name(path, jd, pol)
+            if os.path.exists(name):
+                shutil.rmtree(name)
+
+            uv = aipy.miriad.UV(name, status='new')
+            uv._wrhd('obstype', 'mixed-auto-cross')
+            uv._wrhd('history', 'synth_utils.write_files\n')
+            for var, kind, value in [('nchan', 'i', nchan), ('sdf', 'd', sdf), ('sfreq', 'd', sfreq), ('nants', 'i', max(ants) + 1), ('npol', 'i', 1), ('pol', 'i', aipy.miriad.str2pol[pol]), ('lst', 'd', 0.), ('inttime', 'r', INT_TIME * 86400), ('telescop', 'a', 'HERA')]:
+                uv.add_var(var, kind)
+                uv[var] = value
+
+            for time in range(ntimes):
+                t = jd + time * INT_TIME
+                uv['lst'] = 2 * np.pi * (t % 1)
+                noise = rng.randn(len(pairs), nchan) + 1j * rng.randn(len(pairs), nchan)
+                data = (source + 0.1 * noise).astype(np.complex64)
+                flags = rng.rand(len(pairs), nchan) < flag_frac
+                if flag_first and time == 0:
+                    flags[:] = True
+                for pair, d, f in zip(pairs, data, flags):
+                    uv.write((np.zeros(3), t, pair), np.ma.array(d, mask=f))
+            del(uv)
+            files[pol].append(name)
+
+    return [files[pol] for pol in pols]
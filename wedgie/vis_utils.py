@@ -0,0 +1,74 @@
+"""
+Module for the columnar container of visibilities that the wedge modes read
+"""
+import numpy as np
+
+class Visibilities:
+    """
+    Visibilities and flags of a set of antenna pairs, held as contiguous
+    (npol, nbl, ntimes, nchan) arrays, with index arrays of the pairs (nbl, 2), times,
+    LSTs, frequencies and channel numbers along the other axes.
+
+    Products may share their flags in turn, e.g. Stokes I and Q, then U and V, in which
+    case flags is (nflag, nbl, ntimes, nchan) and product p uses flags[p // share].
+    Every view of a pol, baseline or set of channels is zero-copy.
+    """
+    def __init__(self, data, flags, pols, pairs, times, lsts, freqs, chans=None):
+        self.data = data
+        self.flags = flags
+        self.pols = list(pols)
+        self.pairs = np.asarray(pairs).reshape(-1, 2)
+        self.times = np.asarray(times)
+        self.lsts = np.asarray(lsts)
+        self.freqs = np.asarray(freqs)
+        self.chans = np.arange(len(self.freqs)) if chans is None else np.asarray(chans)
+        self.share = len(data) // len(flags)
+        self.pol_index = dict((pol, index) for index, pol in enumerate(self.pols))
+        self.pair_index = dict((tuple(pair), index) for index, pair in enumerate(self.pairs.tolist()))
+
+    def __len__(self):
+        return len(self.pols)
+
+    def pol(self, pol):
+        """
+        Returns the (nbl, ntimes, nchan) data and flags of pol.
+        """
+        index = self.pol_index[pol]
+        return self.data[index], self.flags[index // self.share]
+
+    def baseline(self, pair):
+        """
+        Returns the (npol, ntimes, nchan) data and (nflag, ntimes, nchan) flags of pair.
+        """
+        index = self.pair_index[tuple(pair)]
+        return self.data[:, index], self.flags[:, index]
+
+    def pol_view(self, pol):
+        """
+        Returns a Visibilities of pol alone.
+        """
+        index = self.pol_index[pol]
+        flag = index // self.share
+        return Visibilities(self.data[index:index + 1], self.flags[flag:flag + 1], [pol], self.pairs, self.times, self.lsts, self.freqs, self.chans)
+
+    def channels(self, chans):
+        """
+        Returns a Visibilities of the channels of the slice chans, as indexed in this one.
+        """
+        return Visibilities(self.data[..., chans], self.flags[..., chans], self.pols, self.pairs, self.times, self.lsts, self.freqs[chans], self.chans[chans])
+
+    @classmethod
+    def from_triple(cls, t, d, f, pairs, pols, chans=None):
+        """
+        Returns the Visibilities of pairs and pols from the (t, d, f) triple of
+        capo.miriad.read_files (or miriad_utils.read_files), taking the slice chans of
+        t['freqs'] if its data are already cut down to those channels.
+        """
+        data = np.array([[d[pair][pol] for pair in pairs] for pol in pols])
+        flags = np.array([[f[pair][pol] for pair in pairs] for pol in pols])
+        freqs = t['freqs'] if chans is None else t['freqs'][chans]
+        channels = np.arange(len(t['freqs']))
+        if chans is not None:
+            channels = channels[chans]
+
+        return cls(data, flags, pols, pairs, t['times'], t['lsts'], freqs, channels)
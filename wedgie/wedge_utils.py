@@ -1,7 +1,7 @@
 """
 Module for wedge-creation methods
 """
-import capo, aipy, os, pprint, sys, decimal
+import aipy, os, pprint, sys, decimal, cPickle, copy_reg, multiprocessing, hashlib
 from IPython import embed
 import matplotlib.pyplot as plt
 import matplotlib.gridspec as gridspec
@@ -10,6 +10,13 @@ import numpy as np
 import scipy.constants as sc
 import gen_utils as gu
 import cosmo_utils as cu
+import deconv_utils as du
+import cache_utils as ch
+import stats_utils as su
+import npz_utils as nu
+import miriad_utils as mu
+import vis_utils as vu
+import profile_utils as pu
 import matplotlib.image as mpimg
 
 # Calfile specific Operations:
@@ -32,7 +39,124 @@ def calculate_baseline(antennae, pair):
     
     return float(baseline)
 
-def get_baselines(calfile, ex_ants):
+# AntennaArrays built so far in this process, keyed on (calfile, sdf, sfreq, nchan).
+AA_CACHE = {}
+
+# ephem.Observer state that does not survive pickling and is restored by hand.
+AA_LOCATION = ['lat', 'lon', 'elevation', 'epoch', 'date', 'temp', 'pressure', 'horizon']
+
+def reduce_alm(alm):
+    return (rebuild_alm, (alm.lmax(), alm.mmax(), alm.get_data()))
+
+def rebuild_alm(lmax, mmax, data):
+    alm = aipy.healpix.Alm(lmax, mmax)
+    alm.set_data(data)
+    return alm
+
+# Beam objects hold healpix Alm coefficients, which cannot be pickled on their own.
+copy_reg.pickle(aipy.healpix.Alm, reduce_alm)
+
+@pu.profiled('aa')
+def get_aa(calfile, filename, cache_dir=None):
+    """
+    Returns the AntennaArray of calfile for the frequency setup of the miriad file
+    filename, built once per process and pickled in cache_dir, if given.
+    """
+    uv = aipy.miriad.UV(filename)
+    key = (calfile.split('.')[0], uv['sdf'], uv['sfreq'], uv['nchan'])
+    del(uv)
+
+    if key in AA_CACHE:
+        return AA_CACHE[key]
+
+    pkl_name = None
+    if cache_dir is not None:
+        pkl_name = os.path.join(cache_dir, "{}.{!r}_{!r}_{}.aa.pkl".format(*key))
+
+    if pkl_name is not None and os.path.exists(pkl_name):
+        with open(pkl_name, 'rb') as pkl:
+            aa, location = cPickle.load(pkl)
+        for attr in AA_LOCATION:
+            setattr(aa, attr, location[attr])
+    else:
+        aa = aipy.cal.get_aa(*key)
+        if pkl_name is not None:
+            location = {attr: float(getattr(aa, attr)) for attr in AA_LOCATION}
+            with ch.atomic_open(pkl_name) as pkl:
+                cPickle.dump((aa, location), pkl, cPickle.HIGHEST_PROTOCOL)
+
+    AA_CACHE[key] = aa
+    return aa
+
+# Redundancy indices computed so far in this process, keyed on (calfile, ex_ants).
+BASELINE_CACHE = {}
+
+def cluster_keys(values, tol, period=None):
+    """
+    Returns integer keys grouping values into runs whose sorted neighbours lie within tol
+    of each other, on a circle of the given period, if any.
+    """
+    order = np.argsort(values)
+    sorted_values = values[order]
+    keys = np.empty(len(values), dtype=int)
+    keys[order] = np.r_[0, np.cumsum(np.diff(sorted_values) > tol)]
+
+    if period is not None and len(values) and sorted_values[0] + period - sorted_values[-1] <= tol:
+        keys[keys == keys[order[-1]]] = 0
+    return keys
+
+def get_redundancy(calfile, ex_ants, length_tol=1e-3, angle_tol=1e-6, cache_dir=None):
+    """
+    Returns the pairs of calfile without the antennae in ex_ants, the index of the length
+    and slope group of every pair, and the baselines and slopes of the groups, grouped to
+    within length_tol (m) and angle_tol (rad). Pickled in cache_dir, if given.
+    """
+    exec("import {cfile} as cal".format(cfile=calfile))
+    antennae = cal.prms['antpos_ideal']
+
+    # Remove all placeholder antennae from consideration
+    # Remove all antennae from ex_ants from consideration
+    ants = np.array([ant for ant in antennae.keys() if (not antennae[ant]['top_z'] < 0) and (ant not in ex_ants)])
+
+    pkl_name = None
+    if cache_dir is not None:
+        positions = repr(sorted([(ant, sorted(antennae[ant].items())) for ant in ants]))
+        digest = hashlib.sha1(positions + repr((length_tol, angle_tol))).hexdigest()[:16]
+        pkl_name = os.path.join(cache_dir, "{}.{}.bl.pkl".format(calfile, digest))
+        if os.path.exists(pkl_name):
+            with open(pkl_name, 'rb') as pkl:
+                return cPickle.load(pkl)
+
+    # Pairs in the order of a double loop over ants, keeping ant_i < ant_j
+    ant_i, ant_j = np.meshgrid(np.arange(len(ants)), np.arange(len(ants)), indexing='ij')
+    keep = ants[ant_i] < ants[ant_j]
+    ant_i, ant_j = ant_i[keep], ant_j[keep]
+    pairs = np.array([ants[ant_i], ants[ant_j]]).T
+
+    x = np.array([antennae[ant]['top_x'] for ant in ants])
+    y = np.array([antennae[ant]['top_y'] for ant in ants])
+    dx, dy = x[ant_j] - x[ant_i], y[ant_j] - y[ant_i]
+
+    # Integer grouping keys: length, and orientation folded onto [0, pi)
+    length_key = cluster_keys(np.hypot(dx, dy), length_tol)
+    angle_key = cluster_keys(np.mod(np.arctan2(dy, dx), np.pi), angle_tol, period=np.pi)
+
+    # Label each group by its first pair, with the arithmetic get_baselines has always used
+    length_keys, bl_index = np.unique(length_key, return_inverse=True)
+    angle_keys, slope_index = np.unique(angle_key, return_inverse=True)
+    baselines = [calculate_baseline(antennae, tuple(pairs[first])) for first in np.unique(bl_index, return_index=True)[1]]
+    slopes = [calculate_slope(antennae, tuple(pairs[first])) for first in np.unique(slope_index, return_index=True)[1]]
+
+    redundancy = {'pairs': pairs, 'bl_index': bl_index, 'slope_index': slope_index, 'baselines': baselines, 'slopes': slopes}
+
+    if pkl_name is not None:
+        with ch.atomic_open(pkl_name) as pkl:
+            cPickle.dump(redundancy, pkl, cPickle.HIGHEST_PROTOCOL)
+
+    return redundancy
+
+@pu.profiled('baselines')
+def get_baselines(calfile, ex_ants, cache_dir=None):
     """
     Returns a dictionary of baseline lengths and the corresponding pairs. The data is based 
     on a calfile. ex_ants is a list of integers that specify antennae to be exlcuded from 
@@ -40,575 +164,778 @@ def get_baselines(calfile, ex_ants):
     
     Requires cal file to be in PYTHONPATH.
     """
+    key = (calfile, tuple(sorted(ex_ants)))
+    if key in BASELINE_CACHE:
+        return BASELINE_CACHE[key]
+
     try:
         print 'Reading calfile: %s.' %calfile
-        exec("import {cfile} as cal".format(cfile=calfile))
-        antennae = cal.prms['antpos_ideal']
+        redundancy = get_redundancy(calfile, ex_ants, cache_dir=cache_dir)
     except ImportError:
         raise Exception("Unable to import {cfile}.".format(cfile=calfile))
-    
-    # Remove all placeholder antennae from consideration
-    # Remove all antennae from ex_ants from consideration
-    ants = []
-    for ant in antennae.keys():
-        if (not antennae[ant]['top_z'] < 0) and (ant not in ex_ants):
-            ants.append(ant)
-
-    # Form pairs of antennae
-    # Store unique baselines and slopes for later use
-    pairs, baselines, slopes =  {}, [], []
-    for ant_i in ants:
-        for ant_j in ants:
-            if (ant_i >= ant_j): continue
-            pair = (ant_i, ant_j)
-
-            baseline = calculate_baseline(antennae, pair)
-            baselines.append(baseline)
-            
-            slope = calculate_slope(antennae, pair)
-            slopes.append(slope)
-            
-            pairs[pair] = (baseline, slope)
-
-    # Remove duplicates baseline and slope values
-    baselines = set(baselines)
-    slopes = set(slopes)
-
-    # Initalize antdict with baselines as keys and empty lists as values
-    antdict = {baseline: [] for baseline in baselines}
-
-    # Add pairs to the list of their respective baseline
-    for pair in pairs:
-        baseline = pairs[pair][0]
-        antdict[baseline].append(pair)
 
-    # Initialize slopedict with baselines for keys and the dictionary of slopes for each value
-    slopedict = {}
-    for baseline in baselines:
-        slopedict[baseline] = {slope: [] for slope in slopes}
+    bl_labels = [redundancy['baselines'][index] for index in redundancy['bl_index']]
+    slope_labels = [redundancy['slopes'][index] for index in redundancy['slope_index']]
+
+    pairs = {}
+    for pair, baseline, slope in zip(redundancy['pairs'].tolist(), bl_labels, slope_labels):
+        pairs[tuple(pair)] = (baseline, slope)
 
-    # Add pairs to their respective slope within their respective baseline
+    # antdict: baselines as keys, pairs as values
+    # slopedict: baselines as keys, dictionaries of slopes and their pairs as values
+    antdict, slopedict = {}, {}
     for pair in pairs:
-        baseline = pairs[pair][0]
-        slope = pairs[pair][1]
-        slopedict[baseline][slope].append(pair)
+        baseline, slope = pairs[pair]
+        antdict.setdefault(baseline, []).append(pair)
+        slopedict.setdefault(baseline, {}).setdefault(slope, []).append(pair)
 
-    for baseline in slopedict.copy():
-        for slope in slopedict[baseline].copy():
-            if slopedict[baseline][slope] == []:
-                del slopedict[baseline][slope]
+    BASELINE_CACHE[key] = (antdict, slopedict, pairs, sorted(set(bl_labels)), sorted(set(slope_labels)))
+    return BASELINE_CACHE[key]
 
-    return (antdict, slopedict, pairs, sorted(list(baselines)), sorted(list(slopes)))
+# Delay-transform engine:
+def order_pairs(groups):
+    """
+    Flattens a dictionary of antenna pair lists into one list ordered by key, and returns
+    the group index of every pair for group_average. The groups are also set as the
+    redundant groups that --profile breaks the per-baseline stages down by.
+    """
+    pu.set_groups(groups)
+    pairs, group_index = [], []
+    for index, key in enumerate(sorted(groups.keys())):
+        pairs.extend(groups[key])
+        group_index.extend([index] * len(groups[key]))
 
-# Data analysis functions:
-def in_out_avg(npz_name):
-    data = np.load(npz_name)
-    history = data['hist'].tolist()
-    num_files = len(history['filenames'])
+    return pairs, np.array(group_index)
 
-    light_times = []
-    for length in data['bls']:
-        light_times.append(length / (sc.c * (10**9)))
-
-    total_in, total_out = 0, 0
-    total_in_count, total_out_count = 0, 0
-    for i in range(len(data['bls'])):
-        for index, delay in enumerate(data['dlys']):
-            if abs(delay) >= light_times[i]:
-                total_out += data['wdgslc'][i][index]
-                total_out_count += 1
-            else:
-                total_in += data['wdgslc'][i][index]
-                total_in_count += 1
+def ungroup(blocks, groups, axis=0):
+    """
+    Joins the blocks of rows of every group of groups (see pu.group_rows) along axis and
+    puts the rows back in their original order.
+    """
+    order = np.argsort(np.concatenate([rows for label, rows in groups]), kind='mergesort')
+    return np.take(np.concatenate(blocks, axis=axis), order, axis=axis)
 
-    avg_in = total_in / total_in_count
-    avg_out = total_out / total_out_count
+# Delay transform windows built so far in this process, keyed on (nchan, window).
+WINDOW_CACHE = {}
 
-    return (avg_in, avg_out, num_files)
+def get_window(nchan, window='blackman-harris'):
+    """
+    Returns the window of nchan channels, built once per band size by aipy.dsp.gen_window.
+    """
+    key = (nchan, window)
+    if key not in WINDOW_CACHE:
+        WINDOW_CACHE[key] = aipy.dsp.gen_window(nchan, window=window)
+    return WINDOW_CACHE[key]
 
-def wedge_flavors(args, files, pol, calfile, history, freq_range, ex_ants, stokes=[]):
-    fn1, fn2 = files[0].split('/')[-1].split('.'), files[-1].split('/')[-1].split('.')
-    zen_day_t0, HH_ext, tf = ".".join(fn1[:3]), ".".join(fn1[4:6]), fn2[2]
+def kernel_gain(flags, window='blackman-harris'):
+    """
+    Returns the CLEAN gain of every baseline of a (..., nbl, ntimes, nchan) stack of flags,
+    as aipy.img.beam_gain.
+    """
+    w = get_window(flags.shape[-1], window)
+    with pu.stage('fft'):
+        return np.abs(np.fft.ifft(flags * w, axis=-1)).max(axis=(-2, -1))
 
-    if len(stokes):
-        t, d, f = stokes[0], stokes[1], stokes[2]
-        npz_name = "{}_{}.stokes{}.{}.{}_{}.flavors.npz".format(zen_day_t0, tf, pol, HH_ext, freq_range[0], freq_range[1])
-    else: 
-        t,d,f = capo.miriad.read_files(files, antstr='cross', polstr=pol) 
-        npz_name = "{}_{}.{}.{}.{}_{}.flavors.npz".format(zen_day_t0, tf, pol, HH_ext, freq_range[0], freq_range[1])
-    print npz_name
+def delay_models(data, flags, clean=1e-3, window='blackman-harris', nproc=1, backend='aipy', pairs=None):
+    """
+    Windows, delay transforms and CLEANs a (nbl, ntimes, nchan) stack of visibilities.
+    Returns the CLEAN models, the residuals and the CLEAN gain of every baseline. Under
+    --profile the baselines of pairs are run one redundant group at a time.
+    """
+    groups = pu.group_rows(pairs)
+    if groups:
+        models = []
+        for label, rows in groups:
+            with pu.context(group=label):
+                models.append(delay_models(data[rows], flags[rows], clean, window, nproc, backend))
+        return tuple(ungroup([model[part] for model in models], groups) for part in range(3))
+
+    w = get_window(data.shape[-1], window)
+    with pu.stage('fft'):
+        _dw = np.fft.ifft(data * w, axis=-1)
+        _ker = np.fft.ifft(flags * w, axis=-1)
+    gain = np.abs(_ker).max(axis=(1, 2))
+    with pu.stage('clean'):
+        res = du.deconvolve(_dw, _ker, tol=clean, nproc=nproc, backend=backend)
+
+    return _dw, res, gain
+
+def delay_transform(data, flags, clean=1e-3, window='blackman-harris', nproc=1, backend='aipy', gain=None, pairs=None):
+    """
+    Returns the CLEANed delay spectra of a (nbl, ntimes, nchan) stack of visibilities,
+    using the given CLEAN gains (see kernel_gain) if data only covers some of the files.
+    """
+    _dw, res, _gain = delay_models(data, flags, clean=clean, window=window, nproc=nproc, backend=backend, pairs=pairs)
+    if gain is None:
+        gain = _gain
+    _dw += res / gain[:, np.newaxis, np.newaxis]
 
-    t['freqs'] = t['freqs'][freq_range[0]: freq_range[1]]
-    for key in d.keys():
-        d[key][pol] = d[key][pol][:, freq_range[0]:freq_range[1]]
-        f[key][pol] = f[key][pol][:, freq_range[0]:freq_range[1]]
+    return _dw
 
-    baseline_info = get_baselines(calfile, ex_ants)
-    antdict, slopedict, pairs = baseline_info[0], baseline_info[1], baseline_info[2]
-    baselines, slopes = baseline_info[3], baseline_info[4]
+# Timelines computed so far in this process, keyed on the array location and the times.
+TIMELINE_CACHE = {}
 
-    ntimes, nchan = len(t['times']), len(t['freqs'])
+@pu.profiled('timeline')
+def get_timeline(aa, times):
+    """
+    Returns the LST of every integration in times and the (ntimes, 3) w-rows of the
+    projection matrix of each zenith, computed once per file set.
+    """
+    key = (float(aa.lat), float(aa.lon), tuple(times))
+    if key in TIMELINE_CACHE:
+        return TIMELINE_CACHE[key]
+
+    lsts, zenith_w = [], []
+    for time in times:
+        aa.set_jultime(time)
+        lst = aa.sidereal_time()
+        zenith = aipy.phs.RadioFixedBody(lst, aa.lat)
+        zenith.compute(aa)
+        lsts.append(lst)
+        zenith_w.append(zenith.map[2])
+
+    TIMELINE_CACHE[key] = (lsts, np.array(zenith_w))
+    return TIMELINE_CACHE[key]
+
+def get_lags(args):
+    """
+    Returns the integration lags and the stride of the cross-power products of args.
+    """
+    return tuple(int(lag) for lag in args.lags.split(',')), args.stride
 
-    dt = np.diff(t['times'])[0]
+def lag_slices(ntimes, lags=(1,), stride=2, offset=0, new=0):
+    """
+    Returns the (lag, first, second) slices pairing integration i with i + lag for every
+    lag and every i that is a multiple of stride, in a block starting at integration
+    offset of the run. Pairs ending before index new of the block are left out.
+    """
+    slices = []
+    for lag in lags:
+        start = max(0, new - lag)
+        start += -(offset + start) % stride
+        if start + lag < ntimes:
+            slices.append((lag, slice(start, ntimes - lag, stride), slice(start + lag, ntimes, stride)))
+    return slices
+
+@pu.profiled('phase')
+def get_phase_corrections(aa, pairs, zenith_w, freq_range, slices):
+    """
+    Returns the (nbl, nprod, nchan) table of
+    conj(aa.gen_phs(zenith[j], *pair)) * aa.gen_phs(zenith[i], *pair) for every product
+    (i, j) of slices over the freq_range channels.
+    """
+    bls = np.array([aa.get_baseline(pair[0], pair[1], 'r') for pair in pairs])
+    w = np.dot(bls, zenith_w.T)
+    dw = np.concatenate([w[:, second] - w[:, first] for lag, first, second in slices], axis=1)
+    freqs = aa.get_afreqs()[freq_range[0]:freq_range[1]]
 
-    lst_range = []
+    return np.exp(2j * np.pi * dw[:, :, np.newaxis] * freqs)
 
-    wedgeslices = []
-    for baseline in sorted(slopedict.keys()):
-        vis_sq_baseline = np.zeros((ntimes // 2 ,nchan))
-        for slope in sorted(slopedict[baseline].keys()):
-            vis_sq_slope = np.zeros((ntimes // 2 ,nchan))
-            for pair in slopedict[baseline][slope]:
-                vis_sq_pair = np.zeros((ntimes // 2, nchan))
-
-                uv = aipy.miriad.UV(files[0])
-                aa = aipy.cal.get_aa(calfile.split('.')[0], uv['sdf'], uv['sfreq'], uv['nchan'])
-                del(uv)
-                
-                clean = 1e-3
-                w = aipy.dsp.gen_window(d[pair][pol].shape[-1], window='blackman-harris')
-                _dw = np.fft.ifft(d[pair][pol] * w)
-                _ker= np.fft.ifft(f[pair][pol] * w)
-                gain = aipy.img.beam_gain(_ker)
-                for time in range(_dw.shape[0]):
-                    _dw[time, :], info = aipy.deconv.clean(_dw[time, :], _ker[time, :], tol=clean)
-                    _dw[time, :] += info['res'] / gain
-                ftd_2D_data = np.ma.array(_dw)
-
-                for i in range(ntimes):                     
-                    aa.set_active_pol(pol) 
-                    if i != 0:
-                        old_zenith = zenith
-                    time = t['times'][i]    
-                    aa.set_jultime(time)
-                    lst = aa.sidereal_time()
-                    zenith = aipy.phs.RadioFixedBody(lst, aa.lat)
-                    zenith.compute(aa)
-                    if i==0 and baseline==sorted(slopedict.keys())[0] and slope==sorted(slopedict[baseline])[0] and pair==slopedict[baseline][slope][0]:
-                        lst_range.append(lst)
-                    if i==ntimes-1 and baseline==sorted(slopedict.keys())[0] and slope==sorted(slopedict[baseline])[0] and pair==sorted(slopedict[baseline][slope])[0]:
-                        lst_range.append(lst)
-                    if i == 0:
-                        continue
-
-                    if i % 2:
-                        _v1 = ftd_2D_data[i-1,:]
-                        phase_correction = np.conj(aa.gen_phs(zenith, pair[0], pair[1])) * aa.gen_phs(old_zenith, pair[0], pair[1])
-                        _v2 = ftd_2D_data[i, :] * phase_correction[freq_range[0]: freq_range[1]]
-
-                        vis_sq_pair[i // 2, :] = np.conj(_v1) * _v2
-
-                vis_sq_slope += vis_sq_pair
-
-            vis_sq_slope /= len(slopedict[baseline])
-
-            wedgeslices.append(np.log10(np.fft.fftshift(np.mean(np.abs(vis_sq_slope), axis=0))))
-            print 'Wedgeslice for baseline {} and slope {} complete.'.format(baseline, slope)
-   
-    channel_width = (t['freqs'][1] - t['freqs'][0])*10**3 # Channel width in units of GHz
-    num_bins = len(t['freqs'])
-    delays = np.fft.fftshift(np.fft.fftfreq(num_bins, channel_width / num_bins))
-    
-    np.savez(npz_name, wdgslc=wedgeslices, dlys=delays, pol=pol, bls=baselines, slps=slopes, prs=pairs, slpdct=slopedict, lst=lst_range, hist=history)
-    return npz_name
+def multiply_slices(ftd, phase_correction, slices):
+    """
+    Returns the phased products of the rows of ftd for every lag of slices, in turn.
+    """
+    vissq, column = [], 0
+    with pu.stage('multiply'):
+        for lag, first, second in slices:
+            _v1 = ftd[..., first, :]
+            nprod = _v1.shape[-2]
+            _v2 = ftd[..., second, :] * phase_correction[:, column:column + nprod]
+            vissq.append((np.conj(_v1) * _v2).real)
+            column += nprod
+    return vissq
+
+def cross_multiply(ftd, pairs, times, aa, freq_range, slices=None):
+    """
+    Multiplies integrations i and j of every (..., nbl, ntimes, nchan) row of ftd for each
+    product (i, j) of slices (by default 1*2, 3*4, etc...). Returns the real part of the
+    products, ordered by j then i, and the LSTs of the first and last integration. Under
+    --profile the baselines of pairs are multiplied one redundant group at a time.
+    """
+    lsts, zenith_w = get_timeline(aa, times)
+    if slices is None:
+        slices = lag_slices(len(times))
+    if not slices:
+        return np.zeros(ftd.shape[:-2] + (0, ftd.shape[-1])), [lsts[0], lsts[-1]]
+
+    phase_correction = get_phase_corrections(aa, pairs, zenith_w, freq_range, slices)
+
+    groups = pu.group_rows(pairs)
+    if groups:
+        blocks = []
+        for label, rows in groups:
+            with pu.context(group=label):
+                blocks.append(multiply_slices(ftd[..., rows, :, :], phase_correction[rows], slices))
+        vissq = [ungroup([block[index] for block in blocks], groups, axis=-3) for index in range(len(slices))]
+    else:
+        vissq = multiply_slices(ftd, phase_correction, slices)
 
-def wedge_bltype(args, files, pol, calfile, history, freq_range, ex_ants, stokes=[]):
-    
-    bl_num = args.bl_num
+    if len(vissq) == 1:
+        return vissq[0], [lsts[0], lsts[-1]]
 
-    fn1, fn2 = files[0].split('/')[-1].split('.'), files[-1].split('/')[-1].split('.')
-    zen_day_t0, HH_ext, tf = ".".join(fn1[:3]), ".".join(fn1[4:6]), fn2[2]
+    # Order the products of every lag by their later integration, then their earlier one,
+    # so that the products of a run come out in the same order however it is windowed.
+    index = np.arange(ftd.shape[-2])
+    order = np.lexsort((np.concatenate([index[first] for lag, first, second in slices]), np.concatenate([index[second] for lag, first, second in slices])))
 
-    if len(stokes):
-        t, d, f = stokes[0], stokes[1], stokes[2]
-        npz_name = "{}_{}.stokes{}.{}.{}_{}.bl_{}.npz".format(zen_day_t0, tf, pol, HH_ext, freq_range[0], freq_range[1], bl_num)
-    else:
-        t, d, f = capo.miriad.read_files(files, antstr='cross', polstr=pol)
-        npz_name = "{}_{}.{}.{}.{}_{}.bl_{}.npz".format(zen_day_t0, tf, pol, HH_ext, freq_range[0], freq_range[1], bl_num)
-    print npz_name
+    return np.concatenate(vissq, axis=-2)[..., order, :], [lsts[0], lsts[-1]]
 
-    bl_num -= 1
+# Streaming over files:
+def get_windows(files, stream=None):
+    """
+    Splits files (or each of the xx, xy, yx and yy lists of Stokes) into windows of
+    stream files, or a single window if stream is None.
+    """
+    if len(files) and isinstance(files[0], list):
+        return zip(*[get_windows(pol_files, stream) for pol_files in files])
+    if not stream:
+        return [files]
 
-    t['freqs'] = t['freqs'][freq_range[0]:freq_range[1]]
-    ntimes,nchan = len(t['times']),len(t['freqs'])
+    return [files[index:index + stream] for index in range(0, len(files), stream)]
 
-    for key in d.keys():
-        d[key][pol] = d[key][pol][:,freq_range[0]:freq_range[1]]
-        f[key][pol] = f[key][pol][:,freq_range[0]:freq_range[1]]
+@pu.profiled('read')
+def read_window(files, pol, pairs, freq_range):
+    """
+    Reads pairs, over the channels of freq_range, from one window of files into a
+    vis_utils.Visibilities of pol, or of Stokes I, Q, U and V for pol 'stokes'.
+    """
+    chans = slice(freq_range[0], freq_range[1])
+    if pol == 'stokes':
+        return form_stokes(mu.read_vis([list(pol_files) for pol_files in files], LINEAR, chans, pairs))
 
-    #create variable to store the wedge subplots in
-    antpairslices = []
-    
-    #get dictionary of antennae pairs
-    #keys are baseline lengths, values are list of tuples (antenna numbers)
-    antdict = get_baselines(calfile, ex_ants)[0]
-    baselengths = antdict.keys()
-    baselengths.sort()
+    return mu.read_vis([files], [pol], chans, pairs)
 
-    totald = np.zeros_like(d[antdict[baselengths[bl_num]][0]][pol])
+def get_span(freq_ranges):
+    """
+    Returns the channel range spanning every band of freq_ranges.
+    """
+    return min(band[0] for band in freq_ranges), max(band[1] for band in freq_ranges)
 
-    length = baselengths[bl_num]
+def band_channels(span, freq_range):
+    """
+    Returns the slice of the channels of freq_range in an array read over span.
+    """
+    return slice(freq_range[0] - span[0], freq_range[1] - span[0])
 
-        #access antenna tuples in baselengths dictionary, antpair is antenna tuple
-    for antpair in antdict[baselengths[bl_num]]:
-        
-        #create/get metadata    
-        uv = aipy.miriad.UV(files[0])
-        aa = aipy.cal.get_aa(calfile.split('.')[0], uv['sdf'], uv['sfreq'], uv['nchan']) 
-        del(uv)
-
-        #CLEAN and fft the data
-        clean=1e-3
-        w = aipy.dsp.gen_window(d[antpair][pol].shape[-1], window='blackman-harris')
-        _dw = np.fft.ifft(d[antpair][pol]*w)
-        _ker= np.fft.ifft(f[antpair][pol]*w)
-        gain = aipy.img.beam_gain(_ker)
-        for time in range(_dw.shape[0]):
-            _dw[time,:],info = aipy.deconv.clean(_dw[time,:], _ker[time,:], tol=clean)
-            _dw[time,:] += info['res']/gain
-
-        totald = np.ma.array(_dw)
-
-        #an array to store visibilities^2 per antpair
-        vissq_per_antpair = np.zeros((ntimes // 2 ,nchan))
-
-        #multiply at times (1*2, 3*4, etc...) 
-        for i in range(ntimes):
-             
-            #set up phasing    
-            aa.set_active_pol(pol) 
-            if i!=0:
-                old_zenith = zenith
-            time = t['times'][i]    
-            aa.set_jultime(time)
-            lst = aa.sidereal_time()
-            zenith = aipy.phs.RadioFixedBody(lst, aa.lat)
-            zenith.compute(aa)
-            if i==0:
-                continue
-
-            #phase and multiply, store in vissq_per_antpair
-            if i % 2:
-                _v1 = totald[i-1,:]
-                phase_correction = np.conj(aa.gen_phs(zenith,antpair[0],antpair[1]))*aa.gen_phs(old_zenith,antpair[0],antpair[1])
-                _v2 = totald[i,:]*phase_correction[freq_range[0]:freq_range[1]]
-                vissq_per_antpair[i // 2,:] = np.conj(_v1)*_v2
-    
-        antpairslices.append(np.log10(np.fft.fftshift(np.abs(vissq_per_antpair), axes=1)))
-        print "antpair {antpair} done!!!"
-    
-    antpairs = antdict[baselengths[bl_num]]
+# Antenna pairs of every run so far in this process, keyed on (calfile, ex_ants).
+RUN_PAIRS = {}
 
-    channel_width = (t['freqs'][1] - t['freqs'][0])*10**3
-    num_bins = len(t['freqs'])
-    #get data to recalculate axes  
-    delays = np.fft.fftshift(np.fft.fftfreq(num_bins, channel_width / num_bins))
+def get_run_pairs(calfile, ex_ants):
+    """
+    Returns the sorted list of every antenna pair of calfile without the antennae in
+    ex_ants, of which every wedge mode of a run uses some.
+    """
+    key = (calfile, tuple(sorted(ex_ants)))
+    if key not in RUN_PAIRS:
+        RUN_PAIRS[key] = sorted(get_baselines(calfile, ex_ants)[2].keys())
+    return RUN_PAIRS[key]
 
-    np.savez(npz_name, antpairslc=antpairslices, dlys=delays, pol=pol, antprs=antpairs, length=length, hist=history)
-    return npz_name
+def clean_window(args, files_window, pol, pairs, freq_ranges, clean=1e-3, window='blackman-harris'):
+    """
+    Reads one window of files and CLEANs every product of pairs in each band of
+    freq_ranges. Returns the times, freqs, models, residuals and gains of every band.
+    """
+    span = get_span(freq_ranges)
+    vis = read_window(files_window, pol, pairs, span)
+
+    #products share their flags in turn, e.g. Stokes I and Q, then U and V
+    share = vis.share
+    entries = []
+    for freq_range in freq_ranges:
+        band = vis.channels(band_channels(span, freq_range))
+        mdl, res, gain = [], [], []
+        for prod in range(len(band)):
+            _mdl, _res, _gain = delay_models(band.data[prod], band.flags[prod // share], clean=clean, window=window, nproc=args.nproc, backend=args.clean_backend, pairs=pairs)
+            mdl.append(_mdl)
+            res.append(_res)
+            gain.append(_gain)
+
+        entries.append({'times': band.times, 'freqs': band.freqs, 'mdl': np.array(mdl), 'res': np.array(res), 'gain': np.array(gain[::share])})
+
+    return entries
+
+def window_models(args, files_window, pol, calfile, ex_ants, pairs, freq_ranges, clean=1e-3, window='blackman-harris', gains_only=False):
+    """
+    Returns the times, freqs, models, residuals and gains of pairs in one window of files
+    for every band (see clean_window), or only the gains. With args.dly_cache every pair
+    of the run (see get_run_pairs) is CLEANed once and cached for any wedge mode.
+    """
+    if not args.dly_cache:
+        entries = clean_window(args, files_window, pol, pairs, freq_ranges, clean, window)
+        index = slice(None)
+    else:
+        all_pairs = get_run_pairs(calfile, ex_ants)
+        file_list = [file for pol_files in files_window for file in pol_files] if pol == 'stokes' else files_window
+        keys = [ch.cache_key(file_list, pol, freq_range, window, clean, args.clean_backend, calfile, all_pairs) for freq_range in freq_ranges]
+
+        entries = [ch.load(args.dly_cache, key) for key in keys]
+        missing = [band for band, entry in enumerate(entries) if entry is None]
+        if missing:
+            cleaned = clean_window(args, files_window, pol, all_pairs, [freq_ranges[band] for band in missing], clean, window)
+            for band, entry in zip(missing, cleaned):
+                ch.save(args.dly_cache, keys[band], max_size=int(args.cache_size * 2**30), **entry)
+                entries[band] = entry
+
+        pair_index = dict((pair, index) for index, pair in enumerate(all_pairs))
+        index = [pair_index[pair] for pair in pairs]
+
+    if gains_only:
+        return [entry['gain'][:, index] for entry in entries]
+    return [(entry['times'], entry['freqs'], entry['mdl'][:, index], entry['res'][:, index], entry['gain'][:, index]) for entry in entries]
+
+def fold_window(ftd, times, carry, pairs, aa, freq_range, wedge_sums, lags=(1,), stride=2):
+    """
+    Folds the products of one window of (nprod, nbl, ntimes, nchan) delay spectra, and of
+    the integrations carried over from the previous one, into wedge_sums. Returns the
+    (ftd, times, offset) carried over to the next window.
+    """
+    offset, new = 0, 0
+    if carry is not None:
+        offset, new = carry[2], len(carry[1])
+        if new:
+            ftd = np.concatenate([carry[0], ftd], axis=-2)
+            times = np.concatenate([carry[1], times])
+
+    slices = lag_slices(len(times), lags, stride, offset, new)
+    vissq, lst_range = cross_multiply(ftd, pairs, times, aa, freq_range, slices)
+    for prod, wedge_sum in enumerate(wedge_sums):
+        wedge_sum.add(vissq[prod], lst_range)
+
+    # Keep the integrations that may still start a product with one of the next window.
+    start = max(0, len(times) - max(lags))
+    start += -(offset + start) % stride
+    return ftd[..., start:, :], times[start:], offset + min(start, len(times))
+
+def stream_wedges(args, files, pol, calfile, ex_ants, pairs, group_index, freq_ranges, time_avg=True, clean=1e-3, window='blackman-harris'):
+    """
+    Runs the delay-transform engine over files, args.stream files at a time (or all at
+    once), and yields (nfiles, freq_range, freqs, wedge_sums) for every band of
+    freq_ranges; for every prefix of files with args.stair (see stair_wedges).
+    """
+    if args.stair:
+        for prefix in stair_wedges(args, files, pol, calfile, ex_ants, pairs, group_index, freq_ranges, time_avg, clean, window):
+            yield prefix
+        return
+
+    lags = get_lags(args)
+    if args.dly_cache:
+        #first pass fills the cache and finds the gains, the second folds each file back in
+        windows = get_windows(files, 1)
+        first_files = windows[0][0] if pol == 'stokes' else windows[0]
+        aa = get_aa(calfile, first_files[0], cache_dir=args.aa_cache)
+        gains = np.max([window_models(args, files_window, pol, calfile, ex_ants, pairs, freq_ranges, clean, window, gains_only=True) for files_window in windows], axis=0)
+
+        carries, wedge_sums = [None] * len(freq_ranges), None
+        for files_window in windows:
+            models = window_models(args, files_window, pol, calfile, ex_ants, pairs, freq_ranges, clean, window)
+            if wedge_sums is None:
+                wedge_sums = [[WedgeSum(group_index, time_avg=time_avg) for prod in range(len(models[0][2]))] for freq_range in freq_ranges]
+            for band, (times, freqs, mdl, res, gain) in enumerate(models):
+                ftd = mdl + res / np.repeat(gains[band], len(mdl) // len(gain), axis=0)[:, :, np.newaxis, np.newaxis]
+                carries[band] = fold_window(ftd, times, carries[band], pairs, aa, freq_ranges[band], wedge_sums[band], *lags)
+
+        for band, freq_range in enumerate(freq_ranges):
+            yield len(windows), freq_range, models[band][1], wedge_sums[band]
+        return
 
-def wedge_blavg(args, files, pol, calfile, history, freq_range, ex_ants, stokes=[]):
+    windows = get_windows(files, args.stream)
+    first_files = windows[0][0] if pol == 'stokes' else windows[0]
+    aa = get_aa(calfile, first_files[0], cache_dir=args.aa_cache)
+
+    span = get_span(freq_ranges)
+    bands = [band_channels(span, freq_range) for freq_range in freq_ranges]
+    first = read_window(windows[0], pol, pairs, span)
+    freqs = [first.freqs[chans] for chans in bands]
+    wedge_sums = [[WedgeSum(group_index, time_avg=time_avg) for prod in range(len(first))] for chans in bands]
+    gains = [[None] * len(first.flags) for chans in bands]
+    if len(windows) > 1:
+        gains = [kernel_gain(first.flags[..., chans], window) for chans in bands]
+        for files_window in windows[1:]:
+            flags = read_window(files_window, pol, pairs, span).flags
+            gains = [np.maximum(gain, kernel_gain(flags[..., chans], window)) for gain, chans in zip(gains, bands)]
+
+    carries = [None] * len(bands)
+    for index, files_window in enumerate(windows):
+        if index:
+            vis = read_window(files_window, pol, pairs, span)
+        else:
+            vis, first = first, None
+
+        #products share their flags in turn, e.g. Stokes I and Q, then U and V
+        share = vis.share
+        for band, chans in enumerate(bands):
+            band_vis = vis.channels(chans)
+            ftd = np.array([delay_transform(band_vis.data[prod], band_vis.flags[prod // share], clean=clean, window=window, nproc=args.nproc, backend=args.clean_backend, gain=gains[band][prod // share], pairs=pairs) for prod in range(len(vis))])
+            carries[band] = fold_window(ftd, vis.times, carries[band], pairs, aa, freq_ranges[band], wedge_sums[band], *lags)
+        del(vis, band_vis)
+
+    for band, freq_range in enumerate(freq_ranges):
+        yield len(files[0] if pol == 'stokes' else files), freq_range, freqs[band], wedge_sums[band]
+
+def stair_wedges(args, files, pol, calfile, ex_ants, pairs, group_index, freq_ranges, time_avg=True, clean=1e-3, window='blackman-harris'):
     """
-    Plots wedges per baseline length, averaged over baselines.
-    Remember to not include the ".py" in the name of the calfile
+    Yields (nfiles, freq_range, freqs, wedge_sums) of every band for files[:1],
+    files[:2], ... files, CLEANing each file once. A prefix is refolded from the kept
+    models only when a new file raises the CLEAN gain of some baseline.
+    """
+    windows = get_windows(files, 1)
+    first_files = windows[0][0] if pol == 'stokes' else windows[0]
+    aa = get_aa(calfile, first_files[0], cache_dir=args.aa_cache)
+    lags = get_lags(args)
+
+    nbands = len(freq_ranges)
+    models, gains, wedge_sums, carries = [[] for band in range(nbands)], [None] * nbands, [None] * nbands, [None] * nbands
+    for nfiles, files_window in enumerate(windows, 1):
+        for band, (times, freqs, mdl, res, gain) in enumerate(window_models(args, files_window, pol, calfile, ex_ants, pairs, freq_ranges, clean, window)):
+            models[band].append((times, mdl, res))
+            share = len(mdl) // len(gain)
+
+            if gains[band] is not None and np.array_equal(np.maximum(gains[band], gain), gains[band]):
+                refold = models[band][-1:]
+            else:
+                gains[band] = gain if gains[band] is None else np.maximum(gains[band], gain)
+                wedge_sums[band] = [WedgeSum(group_index, time_avg=time_avg) for prod in range(len(mdl))]
+                refold, carries[band] = models[band], None
+
+            for times, mdl, res in refold:
+                ftd = mdl + res / np.repeat(gains[band], share, axis=0)[:, :, np.newaxis, np.newaxis]
+                carries[band] = fold_window(ftd, times, carries[band], pairs, aa, freq_ranges[band], wedge_sums[band], *lags)
+
+            yield nfiles, freq_ranges[band], freqs, wedge_sums[band]
+
+def group_average(vissq, group_index):
+    """
+    Averages the rows of vissq over each redundant group. group_index must be sorted,
+    as returned by order_pairs.
+    """
+    starts = np.flatnonzero(np.r_[True, group_index[1:] != group_index[:-1]])
+    counts = np.diff(np.r_[starts, len(group_index)])
+
+    return np.add.reduceat(vissq, starts, axis=0) / counts.reshape((-1,) + (1,) * (vissq.ndim - 1))
+
+class WedgeSum:
+    """
+    Running reduction of the vissq blocks of one product into a wedge, averaged over the
+    redundant groups of group_index and, with time_avg, over time.
+    """
+    def __init__(self, group_index, time_avg=True):
+        self.group_index = group_index
+        self.time_avg = time_avg
+        self.total, self.count, self.blocks = 0., 0, []
+        self.lst_range = None
+
+    def add(self, vissq, lst_range):
+        vissq_per_group = np.abs(group_average(vissq, self.group_index))
+        if self.time_avg:
+            for time in range(vissq_per_group.shape[1]):
+                self.total = self.total + vissq_per_group[:, time]
+            self.count += vissq_per_group.shape[1]
+        else:
+            self.blocks.append(vissq_per_group)
+
+        if self.lst_range is None:
+            self.lst_range = list(lst_range)
+        self.lst_range[1] = lst_range[1]
+
+    def wedge(self):
+        """
+        Returns the log10 of the fftshifted wedge, averaged over time if time_avg.
+        """
+        if self.time_avg:
+            return np.log10(np.fft.fftshift(self.total / self.count, axes=-1))
+        return np.log10(np.fft.fftshift(np.concatenate(self.blocks, axis=1), axes=-1))
+
+def run_processes(jobs, nproc):
+    """
+    Runs each (target, args) job of jobs in its own process, at most nproc at a time, or
+    in this process if nproc <= 1.
+    """
+    if nproc <= 1:
+        for target, job_args in jobs:
+            target(*job_args)
+        return
+
+    for start in range(0, len(jobs), nproc):
+        procs = [multiprocessing.Process(target=pu.child(target), args=job_args) for target, job_args in jobs[start:start + nproc]]
+        for proc in procs:
+            proc.start()
+        for proc in procs:
+            proc.join()
+        pu.collect()
+        for proc in procs:
+            if proc.exitcode != 0:
+                raise Exception("Process {} exited with code {}.".format(proc.name, proc.exitcode))
+
+# Wedge reductions:
+def get_npz_name(files, pol, freq_range, mode):
+    """
+    Returns the npz name for files, e.g. "zen.2457746.16693_16817.xx.HH.uvcOR.550_650.timavg.npz".
     """
-    
     fn1, fn2 = files[0].split('/')[-1].split('.'), files[-1].split('/')[-1].split('.')
     zen_day_t0, HH_ext, tf = ".".join(fn1[:3]), ".".join(fn1[4:6]), fn2[2]
 
-    if len(stokes):
-        t, d, f = stokes[0], stokes[1], stokes[2]
-        npz_name = "{}_{}.stokes{}.{}.{}_{}.blavg.npz".format(zen_day_t0, tf, pol, HH_ext, freq_range[0], freq_range[1])
-    else:
-        t, d, f = capo.miriad.read_files(files, antstr='cross', polstr=pol)
-        npz_name = "{}_{}.{}.{}.{}_{}.blavg.npz".format(zen_day_t0, tf, pol, HH_ext, freq_range[0], freq_range[1])
-    print npz_name
+    return "{}_{}.{}.{}.{}_{}.{}.npz".format(zen_day_t0, tf, pol, HH_ext, freq_range[0], freq_range[1], mode)
 
-    t['freqs'] = t['freqs'][freq_range[0]:freq_range[1]]
-    ntimes,nchan = len(t['times']),len(t['freqs'])
+def get_delays(freqs):
+    """
+    Returns the fftshifted delays (ns) of a delay transform over freqs (GHz).
+    """
+    channel_width = (freqs[1] - freqs[0])*10**3 # Channel width in units of GHz
+    num_bins = len(freqs)
 
-    for key in d.keys():
-        d[key][pol] = d[key][pol][:,freq_range[0]:freq_range[1]]
-        f[key][pol] = f[key][pol][:,freq_range[0]:freq_range[1]]
+    return np.fft.fftshift(np.fft.fftfreq(num_bins, channel_width / num_bins))
 
-    #create variable to store the wedge subplots in
-    wedgeslices = []
-    
-    #get dictionary of antennae pairs
-    #keys are baseline lengths, values are list of tuples (antenna numbers)
-    antdict = get_baselines(calfile, ex_ants)[0]
-    baselengths = antdict.keys()
-    baselengths.sort()
-    
-    lst_range = []
-    
-    #for each baselength in the dictionary
+def get_history(history, nfiles):
+    """
+    Returns history with its filenames cut to the first nfiles.
+    """
+    if nfiles >= len(history.get('filenames') or []):
+        return history
+
+    history = dict(history)
+    history['filenames'] = history['filenames'][:nfiles]
+    return history
+
+def flavor_pairs(slopedict):
+    """
+    Orders the pairs of slopedict into one redundant group per (baseline, slope) flavor,
+    by baseline then slope.
+    """
+    flavordict = {}
+    for baseline in slopedict:
+        for slope in slopedict[baseline]:
+            flavordict[(baseline, slope)] = slopedict[baseline][slope]
+
+    return order_pairs(flavordict)
+
+def bltype_pairs(antdict, bl_num):
+    """
+    Returns the pairs of the bl_num-th shortest baseline length (counting from 1), each in
+    a group of its own, which --profile labels by antenna pair.
+    """
+    antpairs = antdict[sorted(antdict.keys())[bl_num - 1]]
+    pu.set_groups(dict((antpair, [antpair]) for antpair in antpairs))
+
+    return antpairs, np.arange(len(antpairs))
+
+def save_flavors(npz_name, freqs, pol, wedgeslices, lst_range, baseline_info, history):
+    antdict, slopedict, pairs, baselines, slopes = baseline_info
+    for baseline in sorted(slopedict.keys()):
+        for slope in sorted(slopedict[baseline].keys()):
+            print 'Wedgeslice for baseline {} and slope {} complete.'.format(baseline, slope)
+
+    return nu.save(npz_name, {'pol': pol, 'prs': pairs, 'slpdct': slopedict, 'lst': lst_range, 'hist': history}, wdgslc=wedgeslices, dlys=get_delays(freqs), frqs=freqs, bls=baselines, slps=slopes)
+
+def save_bltype(npz_name, freqs, pol, antpairslices, bl_num, baseline_info, history):
+    antdict = baseline_info[0]
+    length = sorted(antdict.keys())[bl_num - 1]
+    antpairs = antdict[length]
+
+    #one wedge subplot per antpair
+    for antpair in antpairs:
+        print "antpair {} done!!!".format(antpair)
+
+    return nu.save(npz_name, {'pol': pol, 'hist': history}, antpairslc=antpairslices, dlys=get_delays(freqs), frqs=freqs, antprs=antpairs, length=length)
+
+def save_blavg(npz_name, freqs, pol, wedgeslices, lst_range, baseline_info, history):
+    baselengths = sorted(baseline_info[0].keys())
     for length in baselengths:
-        
-        totald = np.zeros_like(d[antdict[length][0]][pol]) #variable to store cumulative fft data
-        vissq_per_bl = np.zeros((ntimes // 2 ,nchan))
-
-        #cycle through every ant pair of the given baselength
-        for antpair in antdict[length]:
-
-            #create/get metadata    
-            uv = aipy.miriad.UV(files[0])
-            aa = aipy.cal.get_aa(calfile, uv['sdf'], uv['sfreq'], uv['nchan']) 
-            del(uv)
-
-
-            #CLEAN and fft the data
-            clean=1e-3
-            w = aipy.dsp.gen_window(d[antpair][pol].shape[-1], window='blackman-harris')
-            _dw = np.fft.ifft(d[antpair][pol]*w)
-            _ker= np.fft.ifft(f[antpair][pol]*w)
-            gain = aipy.img.beam_gain(_ker)
-            for time in range(_dw.shape[0]):
-                _dw[time,:],info = aipy.deconv.clean(_dw[time,:], _ker[time,:], tol=clean)
-                _dw[time,:] += info['res']/gain
-          
-            totald += np.ma.array(_dw) #WTF IS HAPPENING HERE
-
-            #holds our data
-            vissq_per_antpair = np.zeros((ntimes // 2 ,nchan))
-
-            #multiply at times (1*2, 3*4, etc...) 
-            for i in range(ntimes):
-                 
-                #set up phasing    
-                aa.set_active_pol(pol) 
-                if i!=0:
-                    old_zenith = zenith
-                time = t['times'][i]    
-                aa.set_jultime(time)
-                lst = aa.sidereal_time()
-                zenith = aipy.phs.RadioFixedBody(lst, aa.lat)
-                zenith.compute(aa)
-                if i==0 and length==baselengths[0] and antpair==antdict[length][0]:
-                    lst_range.append(lst)
-                if i==ntimes-1 and length==baselengths[0] and antpair==antdict[length][0]:
-                    lst_range.append(lst)
-                if i==0:
-                    continue
-
-                #phase and multiply, store in vissq_per_antpair
-                if i % 2:
-                    _v1 = totald[i-1,:]
-                    phase_correction = np.conj(aa.gen_phs(zenith,antpair[0],antpair[1]))*aa.gen_phs(old_zenith,antpair[0],antpair[1])
-                    _v2 = totald[i,:]*phase_correction[freq_range[0]:freq_range[1]]
-                    vissq_per_antpair[i // 2,:] = np.conj(_v1)*_v2
-
-            #store time average for this baseline length
-            vissq_per_bl += vissq_per_antpair
-        
-        
-        #get average of all values for this baselength, store in wedgeslices
-        vissq_per_bl /= len(antdict[length])
-        wedgeslices.append(np.log10(np.fft.fftshift(np.abs(vissq_per_bl), axes=1)))
         print 'baseline {} complete.'.format(length)
 
-    channel_width = (t['freqs'][1] - t['freqs'][0])*10**3 # Channel width in units of GHz
-    num_bins = len(t['freqs'])
-    #get data to recalculate axes  
-    delays = np.fft.fftshift(np.fft.fftfreq(num_bins, channel_width / num_bins))
-
-    #save filedata as npz
     #NB: filename of form like "zen.2457746.16693.xx.HH.uvcOR"
-    np.savez(npz_name, wdgslc=wedgeslices, dlys=delays, pol=pol, bls=baselengths, lst=lst_range, hist=history)
-    return npz_name
+    return nu.save(npz_name, {'pol': pol, 'lst': lst_range, 'hist': history}, wdgslc=wedgeslices, dlys=get_delays(freqs), frqs=freqs, bls=baselengths)
 
-def wedge_timeavg(args, files, pol, calfile, history, freq_range, ex_ants, stokes=[]):
+def save_timeavg(npz_name, freqs, pol, wedgeslices, lst_range, baseline_info, history):
+    baselengths = sorted(baseline_info[0].keys())
+    for baselength in baselengths:
+        print 'Wedgeslice for baseline {} complete.'.format(baselength)
+
+    lst_range = [str(lst) for lst in lst_range]
+    return nu.save(npz_name, {'pol': pol, 'lst': lst_range, 'hist': history}, wdgslc=wedgeslices, dlys=get_delays(freqs), frqs=freqs, bls=baselengths)
+
+# Data analysis functions:
+def in_out_avg(npz_name, buffer=0.):
     """
-    Plots wedges per baseline length, averaged over baselines and time
-    if stokes is specified, then it should be of form [t, d, f]
+    Returns the average values inside and outside the wedge of npz_name, along with its
+    number of files.
     """
-    fn1, fn2 = files[0].split('/')[-1].split('.'), files[-1].split('/')[-1].split('.')
-    zen_day_t0, HH_ext, tf = ".".join(fn1[:3]), ".".join(fn1[4:6]), fn2[2]
+    stats = dict(zip([name for name, dtype in su.STATS_DTYPE], su.npz_stats(npz_name, buffer)))
 
-    if len(stokes):
-        t, d, f = stokes[0], stokes[1], stokes[2]
-        npz_name = "{}_{}.stokes{}.{}.{}_{}.timeavg.npz".format(zen_day_t0, tf, pol, HH_ext, freq_range[0], freq_range[1])
-    else:
-        t, d, f = capo.miriad.read_files(files, antstr='cross', polstr=pol)
-        npz_name = "{}_{}.{}.{}.{}_{}.timavg.npz".format(zen_day_t0, tf, pol, HH_ext, freq_range[0], freq_range[1])
-    print npz_name
+    return (stats['mean_in'], stats['mean_out'], stats['num_files'])
 
-    t['freqs'] = t['freqs'][freq_range[0]: freq_range[1]]
+def wedge_flavors(args, files, pol, calfile, history, freq_ranges, ex_ants):
+    baseline_info = get_baselines(calfile, ex_ants, cache_dir=args.aa_cache)
+    pairs, group_index = flavor_pairs(baseline_info[1])
 
-    for key in d.keys():
-        d[key][pol] = d[key][pol][:, freq_range[0]: freq_range[1]]
-        f[key][pol] = f[key][pol][:, freq_range[0]: freq_range[1]]
+    #average over the antpairs of each flavor, then over time
+    for nfiles, freq_range, freqs, (wedge_sum,) in stream_wedges(args, files, pol, calfile, ex_ants, pairs, group_index, freq_ranges):
+        npz_name = get_npz_name(files[:nfiles], pol, freq_range, 'flavors')
+        print npz_name
+        save_flavors(npz_name, freqs, pol, wedge_sum.wedge(), wedge_sum.lst_range, baseline_info, get_history(history, nfiles))
+    return npz_name
+
+def wedge_bltype(args, files, pol, calfile, history, freq_ranges, ex_ants):
+    bl_num = args.bl_num
 
-    #stores vis^2 for each baselength averaged over time
-    wedgeslices = []
-    
     #get dictionary of antennae pairs
     #keys are baseline lengths, values are list of tuples (antenna numbers)
-    antdict = get_baselines(calfile, ex_ants)[0]
-    baselengths = antdict.keys()
-    baselengths.sort()
+    baseline_info = get_baselines(calfile, ex_ants, cache_dir=args.aa_cache)
+    antpairs, group_index = bltype_pairs(baseline_info[0], bl_num)
+
+    #CLEAN, fft and multiply at times (1*2, 3*4, etc...) for every antpair at once
+    for nfiles, freq_range, freqs, (wedge_sum,) in stream_wedges(args, files, pol, calfile, ex_ants, antpairs, group_index, freq_ranges, time_avg=False):
+        npz_name = get_npz_name(files[:nfiles], pol, freq_range, 'bl_{}'.format(bl_num))
+        print npz_name
+        save_bltype(npz_name, freqs, pol, wedge_sum.wedge(), bl_num, baseline_info, get_history(history, nfiles))
+    return npz_name
 
-    #get number of times and number of channels
-    ntimes, nchan = len(t['times']), len(t['freqs'])
+def wedge_blavg(args, files, pol, calfile, history, freq_ranges, ex_ants):
+    """
+    Plots wedges per baseline length, averaged over baselines.
+    Remember to not include the ".py" in the name of the calfile
+    """
+    #get dictionary of antennae pairs
+    #keys are baseline lengths, values are list of tuples (antenna numbers)
+    baseline_info = get_baselines(calfile, ex_ants, cache_dir=args.aa_cache)
+    pairs, group_index = order_pairs(baseline_info[0])
+
+    #get average of all values for each baselength
+    for nfiles, freq_range, freqs, (wedge_sum,) in stream_wedges(args, files, pol, calfile, ex_ants, pairs, group_index, freq_ranges, time_avg=False):
+        npz_name = get_npz_name(files[:nfiles], pol, freq_range, 'blavg')
+        print npz_name
+        save_blavg(npz_name, freqs, pol, wedge_sum.wedge(), wedge_sum.lst_range, baseline_info, get_history(history, nfiles))
+    return npz_name
 
-    dt = np.diff(t['times'])[0] #dJD
+def wedge_timeavg(args, files, pol, calfile, history, freq_ranges, ex_ants):
+    """
+    Plots wedges per baseline length, averaged over baselines and time
+    """
+    #get dictionary of antennae pairs
+    #keys are baseline lengths, values are list of tuples (antenna numbers)
+    baseline_info = get_baselines(calfile, ex_ants, cache_dir=args.aa_cache)
+    pairs, group_index = order_pairs(baseline_info[0])
+
+    #compute average for each baseline length, average over time
+    for nfiles, freq_range, freqs, (wedge_sum,) in stream_wedges(args, files, pol, calfile, ex_ants, pairs, group_index, freq_ranges):
+        npz_name = get_npz_name(files[:nfiles], pol, freq_range, 'timavg')
+        print npz_name
+        save_timeavg(npz_name, freqs, pol, wedge_sum.wedge(), wedge_sum.lst_range, baseline_info, get_history(history, nfiles))
+    return npz_name
 
-    lst_range = []
+# Stokes parameters, in the order wedge_stokes stacks them, and the linear pols they
+# are formed from, in the order of the file lists.
+STOKES = ['I', 'Q', 'U', 'V']
+LINEAR = ['xx', 'xy', 'yx', 'yy']
 
-    #get vis^2 for each baselength
-    for baselength in baselengths:
+def stokes_file(files, pol):
+    """
+    Returns the file list of the xx, xy, yx, yy file lists that Stokes pol is named after.
+    """
+    #I and Q are named after the xx files, U and V after the yx files
+    return files[0] if pol in 'IQ' else files[2]
 
-        vissq_per_bl = np.zeros((ntimes // 2 ,nchan))
-        
-        #go through each individual antenna pair
-        for antpair in antdict[baselength]:
-
-            #create/get metadata    
-            uv = aipy.miriad.UV(files[0])
-            aa = aipy.cal.get_aa(calfile, uv['sdf'], uv['sfreq'], uv['nchan']) 
-            del(uv)
-
-            #CLEAN and fft the data
-            clean=1e-3
-            w = aipy.dsp.gen_window(d[antpair][pol].shape[-1], window='blackman-harris')
-            _dw = np.fft.ifft(d[antpair][pol]*w)
-            _ker= np.fft.ifft(f[antpair][pol]*w)
-            gain = aipy.img.beam_gain(_ker)
-            for time in range(_dw.shape[0]):
-                _dw[time,:],info = aipy.deconv.clean(_dw[time,:], _ker[time,:], tol=clean)
-                _dw[time,:] += info['res']/gain
-            ftd_2D_data = np.ma.array(_dw)
-
-            #holds our data
-            vissq_per_antpair = np.zeros((ntimes // 2 ,nchan))
-
-            #multiply at times (1*2, 3*4, etc...) 
-            for i in range(ntimes):
-                 
-                #set up phasing    
-                aa.set_active_pol(pol) 
-                if i!=0:
-                    old_zenith = zenith
-                time = t['times'][i]    
-                aa.set_jultime(time)
-                lst = aa.sidereal_time()
-                zenith = aipy.phs.RadioFixedBody(lst, aa.lat)
-                zenith.compute(aa)
-                if i==0 and baselength==baselengths[0] and antpair==antdict[baselength][0]:
-                    lst_range.append(str(lst))
-                if i==ntimes-1 and baselength==baselengths[0] and antpair==antdict[baselength][0]:
-                    lst_range.append(str(lst))
-                if i==0:
-                    continue
-
-                #phase and multiply, store in vissq_per_antpair
-                if i % 2:
-                    _v1 = ftd_2D_data[i-1,:]
-                    phase_correction = np.conj(aa.gen_phs(zenith,antpair[0],antpair[1]))*aa.gen_phs(old_zenith,antpair[0],antpair[1])
-                    _v2 = ftd_2D_data[i,:]*phase_correction[freq_range[0]:freq_range[1]]
-                    vissq_per_antpair[i // 2,:] = np.conj(_v1)*_v2
-
-            #store time average for this baseline length
-            vissq_per_bl += vissq_per_antpair
-
-        #compute average for baseline length, average over time, and store in wedgeslices
-        vissq_per_bl /= len(antdict[baselength])
-        wedgeslices.append(np.log10(np.fft.fftshift(np.mean(np.abs(vissq_per_bl), axis=0))))
-        print 'Wedgeslice for baseline {} complete.'.format(baselength)
+def form_stokes(vis):
+    """
+    Turns a Visibilities of the LINEAR pols into one of Stokes I, Q, U and V in place.
+    I and Q share their flags, as do U and V.
+    """
+    data, flags = vis.data, vis.flags
+    ixx, ixy, iyx, iyy = [vis.pol_index[pol] for pol in LINEAR]
 
-    #get delays
-    channel_width = (t['freqs'][1] - t['freqs'][0])*10**3 # Channel width in units of GHz
-    num_bins = len(t['freqs'])
-    delays = np.fft.fftshift(np.fft.fftfreq(num_bins, channel_width / num_bins))
-    
-    np.savez(npz_name, wdgslc=wedgeslices, dlys=delays, pol=pol, bls=baselengths, lst=lst_range, hist=history)
-    return npz_name
+    for pair in vis.pairs:
+        bl_data = vis.baseline(pair)[0]
+        xx, xy, yx, yy = bl_data[ixx], bl_data[ixy], bl_data[iyx], bl_data[iyy]
 
-def wedge_stokes(args, files, calfile, history, freq_range, ex_ants):
-    txx, dxx, fxx = capo.miriad.read_files(files[0], antstr='cross', polstr='xx')
-    txy, dxy, fxy = capo.miriad.read_files(files[1], antstr='cross', polstr='xy')
-    tyx, dyx, fyx = capo.miriad.read_files(files[2], antstr='cross', polstr='yx')
-    tyy, dyy, fyy = capo.miriad.read_files(files[3], antstr='cross', polstr='yy')
-
-    #calculate I (VI = Vxx + Vyy)
-    tI = txx
-    dI = {}
-    fI = {}
-    for key in dxx.keys():
-        dI[key] = {'I': dxx[key]['xx'] + dyy[key]['yy'] }
-        fI[key] = {'I': fxx[key]['xx'] + fyy[key]['yy'] }
-
-    stokes = [tI, dI, fI]
-    if args.flavors:
-        wedge_flavors(args, files[0], 'I', calfile, history, freq_range, ex_ants, stokes)
-    elif args.blavg:
-        wedge_blavg(args, files[0], 'I', calfile, history, freq_range, ex_ants, stokes)
-    elif args.bl_num:
-        wedge_bltype(args, files[0], 'I', calfile, history, freq_range, ex_ants, stokes)
-    else:
-        wedge_timeavg(args, files[0], 'I', calfile, history, freq_range, ex_ants, stokes)
-    print 'Stokes I completed.'
-
-    #calculate Q (VQ = Vxx - Vyy)
-    tQ = tyy
-    dQ = {}
-    fQ = {}
-    for key in dxx.keys():
-        dQ[key] = {'Q': dxx[key]['xx'] - dyy[key]['yy'] }
-        fQ[key] = {'Q': fxx[key]['xx'] + fyy[key]['yy'] }
-
-    stokes = [tQ, dQ, fQ]
-    if args.flavors:
-        wedge_flavors(args, files[0], 'Q', calfile, history, freq_range, ex_ants, stokes)
-    elif args.blavg:
-        wedge_blavg(args, files[0], 'Q', calfile, history, freq_range, ex_ants, stokes)
-    elif args.bl_num:
-        wedge_bltype(args, files[0], 'Q', calfile, history, freq_range, ex_ants, stokes)
-    else:
-        wedge_timeavg(args, files[0], 'Q', calfile, history, freq_range, ex_ants, stokes)
-    print 'Stokes Q completed.'
-    
-    #calculate U (VU = Vxy + Vyx)
-    tU = tyx
-    dU = {}
-    fU = {}
-    for key in dxy.keys():
-        dU[key] = {'U': dxy[key]['xy'] + dyx[key]['yx'] }
-        fU[key] = {'U': fxy[key]['xy'] + fyx[key]['yx'] }
-
-    stokes = [tU, dU, fU]
+        I = xx + yy #VI = Vxx + Vyy
+        Q = xx - yy #VQ = Vxx - Vyy
+        U = xy + yx #VU = Vxy + Vyx
+        V = -1j*xy + 1j*yx #VV = -i*Vxy + i*Vyx
+        bl_data[0], bl_data[1], bl_data[2], bl_data[3] = I, Q, U, V
+
+    stokes_flags = np.empty((2,) + flags.shape[1:], dtype=bool)
+    np.logical_or(flags[ixx], flags[iyy], out=stokes_flags[0])
+    np.logical_or(flags[ixy], flags[iyx], out=stokes_flags[1])
+
+    return vu.Visibilities(data, stokes_flags, STOKES, vis.pairs, vis.times, vis.lsts, vis.freqs, vis.chans)
+
+def stokes_pairs(args, baseline_info):
+    """
+    Returns the pairs, group index and time averaging of the wedge mode of wedge_stokes.
+    """
     if args.flavors:
-        wedge_flavors(args, files[2], 'U', calfile, history, freq_range, ex_ants, stokes)
+        return flavor_pairs(baseline_info[1]) + (True,)
     elif args.blavg:
-        wedge_blavg(args, files[2], 'U', calfile, history, freq_range, ex_ants, stokes)
+        return order_pairs(baseline_info[0]) + (False,)
     elif args.bl_num:
-        wedge_bltype(args, files[2], 'U', calfile, history, freq_range, ex_ants, stokes)
-    else:
-        wedge_timeavg(args, files[2], 'U', calfile, history, freq_range, ex_ants, stokes)
-    print 'Stokes U completed.'
-
-    #calculate V (VV = -i*Vxy + i*Vyx)
-    tV = txy
-    dV = {}
-    fV = {}
-    for key in dxy.keys():
-        dV[key] = {'V': -1j*dxy[key]['xy'] + 1j*dyx[key]['yx'] }
-        fV[key] = {'V': fxy[key]['xy'] + fyx[key]['yx'] }
-
-    stokes = [tV, dV, fV]
+        return bltype_pairs(baseline_info[0], args.bl_num) + (False,)
+    return order_pairs(baseline_info[0]) + (True,)
+
+def save_stokes(args, files, pol, freq_range, freqs, wedge_sum, baseline_info, history):
+    """
+    Saves the wedge of Stokes pol for the wedge mode selected by args.
+    """
     if args.flavors:
-        wedge_flavors(args, files[2], 'V', calfile, history, freq_range, ex_ants, stokes)
+        npz_name = get_npz_name(files, 'stokes' + pol, freq_range, 'flavors')
+        save_flavors(npz_name, freqs, pol, wedge_sum.wedge(), wedge_sum.lst_range, baseline_info, history)
     elif args.blavg:
-        wedge_blavg(args, files[2], 'V', calfile, history, freq_range, ex_ants, stokes)
+        npz_name = get_npz_name(files, 'stokes' + pol, freq_range, 'blavg')
+        save_blavg(npz_name, freqs, pol, wedge_sum.wedge(), wedge_sum.lst_range, baseline_info, history)
     elif args.bl_num:
-        wedge_bltype(args, files[2], 'V', calfile, history, freq_range, ex_ants, stokes)
+        npz_name = get_npz_name(files, 'stokes' + pol, freq_range, 'bl_{}'.format(args.bl_num))
+        save_bltype(npz_name, freqs, pol, wedge_sum.wedge(), args.bl_num, baseline_info, history)
     else:
-        wedge_timeavg(args, files[2], 'V', calfile, history, freq_range, ex_ants, stokes)
-    print 'Stokes V completed.'
+        npz_name = get_npz_name(files, 'stokes' + pol, freq_range, 'timeavg')
+        save_timeavg(npz_name, freqs, pol, wedge_sum.wedge(), wedge_sum.lst_range, baseline_info, history)
+    print npz_name
+    print 'Stokes {} completed.'.format(pol)
+
+def stokes_wedge(args, files, pol, calfile, history, freq_range, vis, pairs, group_index, time_avg, baseline_info, nproc):
+    """
+    Makes and saves the wedge of Stokes pol from its Visibilities, vis.
+    """
+    with pu.context(pol='stokes' + pol):
+        aa = get_aa(calfile, files[0], cache_dir=args.aa_cache)
+        data, flags = vis.pol(pol)
+        ftd = delay_transform(data, flags, nproc=nproc, backend=args.clean_backend, pairs=pairs)
+
+        wedge_sum = WedgeSum(group_index, time_avg=time_avg)
+        wedge_sum.add(*cross_multiply(ftd, pairs, vis.times, aa, freq_range, lag_slices(len(vis.times), *get_lags(args))))
+        save_stokes(args, files, pol, freq_range, vis.freqs, wedge_sum, baseline_info, history)
+
+def wedge_stokes(args, files, calfile, history, freq_ranges, ex_ants):
+    """
+    Generates wedges for Stokes I, Q, U and V from the xx, xy, yx and yy file lists, read
+    once for every band. With args.nproc > 1 the products run in concurrent processes.
+    """
+    baseline_info = get_baselines(calfile, ex_ants, cache_dir=args.aa_cache)
+    pairs, group_index, time_avg = stokes_pairs(args, baseline_info)
+
+    if args.stream or args.stair or args.dly_cache:
+        for nfiles, freq_range, freqs, wedge_sums in stream_wedges(args, files, 'stokes', calfile, ex_ants, pairs, group_index, freq_ranges, time_avg):
+            for index, pol in enumerate(STOKES):
+                save_stokes(args, stokes_file(files, pol)[:nfiles], pol, freq_range, freqs, wedge_sums[index], baseline_info, get_history(history, nfiles))
+        return
+
+    span = get_span(freq_ranges)
+    vis = read_window(files, 'stokes', pairs, span)
+
+    # Warm the AntennaArray and timeline caches, so that every Stokes process inherits them.
+    aa = get_aa(calfile, files[0][0], cache_dir=args.aa_cache)
+    get_timeline(aa, vis.times)
+
+    nstokes = max(1, min(len(STOKES) * len(freq_ranges), args.nproc))
+    clean_nproc = max(1, args.nproc // nstokes)
+
+    jobs = []
+    for freq_range in freq_ranges:
+        band = vis.channels(band_channels(span, freq_range))
+        for pol in STOKES:
+            jobs.append((stokes_wedge, (args, stokes_file(files, pol), pol, calfile, history, freq_range, band.pol_view(pol), pairs, group_index, time_avg, baseline_info, clean_nproc)))
+    run_processes(jobs, nstokes)
 
 def wedge_delayavg(npz_name, multi = False):
 
-    plot_data = np.load(npz_name)
+    plot_data = nu.load(npz_name)
     delays, wedgevalues, baselines = plot_data['dlys'], plot_data['wdgslc'], plot_data['bls']
     d_start = plot_data['dlys'][0]
     d_end = plot_data['dlys'][-1]
@@ -628,15 +955,11 @@ def wedge_delayavg(npz_name, multi = False):
     return npz_delayavg
 
 # Plotting functions:
-def plot_avgs(npz_names):
-    total_files = []
-    avgs_in = []
-    avgs_out = []
-    for npz_name in npz_names:
-        avgs_in_out = in_out_avg(npz_name)
-        total_files.append(avgs_in_out[2])
-        avgs_in.append(avgs_in_out[0])
-        avgs_out.append(avgs_in_out[1])
+def plot_avgs(npz_names, buffer=0., nproc=1):
+    table = su.stats_table(npz_names, buffer, nproc)
+    total_files = table.num_files
+    avgs_in = table.mean_in
+    avgs_out = table.mean_out
 
     plot_avgs_out = plt.scatter(total_files, avgs_out)
     plot_avgs_in = plt.scatter(total_files, avgs_in)
@@ -662,9 +985,11 @@ def plot_avgs(npz_names):
     plt.savefig('fig.png')
     plt.show()
 
+    return table
+
 def plot_flavors(npz_name, multi=False):
     npz_name = "".join(npz_name)
-    data = np.load(npz_name)
+    data = nu.load(npz_name)
 
     npz_name = npz_name.split('/')[-1]
 
@@ -683,7 +1008,7 @@ def plot_flavors(npz_name, multi=False):
     plt.xlim((-450, 450))
 
     ticks = []
-    slopedict = data['slpdct'].tolist()
+    slopedict = data['slpdct']
     for baseline in sorted(slopedict.keys()):
         for slope in sorted(slopedict[baseline].keys()):
             ticks.append("{:.3}: {:8.3}".format(baseline, slope))
@@ -737,7 +1062,7 @@ def plot_multi_flavors(npz_names):
 
 def plot_bltype(npz_name):
 
-    plot_data = np.load(npz_name)
+    plot_data = nu.load(npz_name)
 
     d_start = plot_data['dlys'][0]
     d_end = plot_data['dlys'][-1]
@@ -779,7 +1104,7 @@ def plot_bltype(npz_name):
     plt.show()
 
 def plot_blavg(npz_name): 
-    plot_data = np.load(npz_name)
+    plot_data = nu.load(npz_name)
 
     d_start = plot_data['dlys'][0]
     d_end = plot_data['dlys'][-1]
@@ -822,7 +1147,7 @@ def plot_blavg(npz_name):
     plt.show()
 
 def plot_timeavg(npz_name, multi=False):
-    plot_data = np.load(npz_name)
+    plot_data = nu.load(npz_name)
 
     d_start = plot_data['dlys'][0]
     d_end = plot_data['dlys'][-1]
@@ -871,7 +1196,7 @@ def plot_multi_timeavg(npz_names):
 
 def plot_delayavg(npz_delayavg):
     
-    plot_data = np.load(npz_delayavg)
+    plot_data = nu.load(npz_delayavg)
     delays, wedgevalues, baselines = plot_data['dlys'], plot_data['wdgslc'], plot_data['bls']
     d_start = plot_data['dlys'][0]
     d_end = plot_data['dlys'][-1]
@@ -909,7 +1234,7 @@ def plot_1D(npz_name, baselines=[]):
     then only plots the provided baselines.
     """
 
-    plot_data = np.load(npz_name)
+    plot_data = nu.load(npz_name)
 
     if len(baselines):
         baselines = [i-1 for i in baselines]
@@ -952,7 +1277,7 @@ def plot_multi_1D(npz_names, baselines=[]):
     then only plots the the provided baselines.
     """
 
-    plot_data = np.load(npz_names[0])
+    plot_data = nu.load(npz_names[0])
     #set up baselines
     if len(baselines):
         baselines = [i-1 for i in baselines]
@@ -968,7 +1293,7 @@ def plot_multi_1D(npz_names, baselines=[]):
     for n in range(len(npz_names)):
         
         #load data, format plotting section
-        plot_data = np.load(npz_names[n])
+        plot_data = nu.load(npz_names[n])
         axes = plt.subplot(G[:,n:n+1])
         
         #plot the data
@@ -1001,4 +1326,22 @@ def plot_multi_1D(npz_names, baselines=[]):
     
     plt.tight_layout()
     plt.savefig(npz_name.split(polorder[0])[0]+polorder+npz_name.split(polorder[0])[-1][:-3] + "multi1D." + blstr + ".png")
-    plt.show()
\ No newline at end of file
+    plt.show()
+
+def plot_kbin(npz_name):
+    plot_data = nu.load(npz_name)
+    kpr, kpl = plot_data['kpr'], plot_data['kpl']
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        plot = plt.pcolormesh(kpr, kpl, np.log10(plot_data['pspec']).T)
+    plt.xlabel("k_perpendicular (h/Mpc)", size='medium')
+    plt.ylabel("k_parallel (h/Mpc)", size='medium')
+    cbar = plt.colorbar()
+    cbar.set_label("log10((mK)^2)")
+    plt.xlim((kpr[0], kpr[-1]))
+    plt.ylim((kpl[0], kpl[-1]))
+
+    npz_name = npz_name.split('/')[-1]
+    plt.title(npz_name, size='medium')
+    plt.savefig(npz_name[:-3] + 'png')
+    plt.show()